@@ -1,12 +1,45 @@
+import atexit
+import bisect
+import heapq
+import itertools
+import multiprocessing
+import os
 import threading
+import time
+import tracemalloc
+import zlib
+from array import array
+from collections import deque
 from enum import Enum
-from typing import List, Optional
+from queue import Full, Queue, SimpleQueue
+from typing import Callable, List, Optional, Tuple, Union
 import datetime
 
 # Enum for Auction Status
 class AuctionStatus(Enum):
     ACTIVE = 1
     CLOSED = 2
+    CANCELLED = 3
+
+# Enum for Search Result Order
+class SearchOrder(Enum):
+    ENDING_SOON = 1
+    HIGHEST_BID = 2
+
+# Enum for Shard Commands sent by the router
+class ShardCommand(Enum):
+    REGISTER_USER = 1
+    CREATE_LISTING = 2
+    PLACE_BID = 3
+    SEARCH = 4
+    BATCH = 5
+    STOP = 6
+
+# Enum for Watcher Event Type
+class AuctionEventType(Enum):
+    PRICE_UPDATE = 1
+    OUTBID = 2
+    CLOSED = 3
 
 # Bid Class
 class Bid:
@@ -33,9 +66,227 @@ class User:
         return self.id
 
 
+# Bid History Class, append-only bid columns for one listing
+class BidHistory:
+    # Amounts are stored as integer cents and timestamps as epoch microseconds
+    AMOUNT_SCALE = 100
+
+    def __init__(self):
+        self.bid_ids = []
+        self.bidder_codes = array("I")
+        self.amounts = array("q")
+        self.timestamps = array("q")
+        # Bidders are interned to small integer codes, with a row index per bidder
+        self.codes = {}
+        self.bidders = []
+        self.by_bidder = {}
+
+    def append(self, bid: Bid):
+        code = self.codes.get(bid.bidder.id)
+        if code is None:
+            code = len(self.bidders)
+            self.codes[bid.bidder.id] = code
+            self.bidders.append(bid.bidder)
+            self.by_bidder[code] = array("I")
+        self.by_bidder[code].append(len(self.bid_ids))
+        self.bid_ids.append(bid.id)
+        self.bidder_codes.append(code)
+        self.amounts.append(round(bid.amount * self.AMOUNT_SCALE))
+        self.timestamps.append(round(bid.timestamp.timestamp() * 1_000_000))
+
+    def __len__(self):
+        return len(self.bid_ids)
+
+    def __iter__(self):
+        for row in range(len(self.bid_ids)):
+            yield self.get_bid(row)
+
+    def get_bid(self, row: int) -> Bid:
+        bid = Bid(self.bid_ids[row], self.bidders[self.bidder_codes[row]], self.amounts[row] / self.AMOUNT_SCALE)
+        bid.timestamp = datetime.datetime.fromtimestamp(self.timestamps[row] / 1_000_000)
+        return bid
+
+    def get_page(self, cursor: Optional[int] = None, limit: int = 50):
+        # Newest first; returns (bids, next_cursor) where the cursor is the row to continue from
+        end = len(self.bid_ids) if cursor is None else cursor
+        start = max(0, end - limit)
+        bids = [self.get_bid(row) for row in range(end - 1, start - 1, -1)]
+        return bids, start if start > 0 else None
+
+    def get_bids_by_user(self, user_id: str) -> List[Bid]:
+        code = self.codes.get(user_id)
+        if code is None:
+            return []
+        return [self.get_bid(row) for row in self.by_bidder[code]]
+
+    def get_bid_count_by_user(self, user_id: str) -> int:
+        code = self.codes.get(user_id)
+        return 0 if code is None else len(self.by_bidder[code])
+
+
+# Auction Event Log Class, prints on a background thread so bidders never wait on the console
+class AuctionEventLog:
+    _instance = None
+    _instance_lock = threading.Lock()
+    CAPACITY = 10000
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = super().__new__(cls)
+                    instance.queue = Queue(maxsize=cls.CAPACITY)
+                    instance.enabled = True
+                    instance.output = None
+                    instance.dropped = 0
+                    instance.thread = threading.Thread(target=instance._run, name="auction-log", daemon=True)
+                    instance.thread.start()
+                    atexit.register(instance.flush)
+                    cls._instance = instance
+        return cls._instance
+
+    @classmethod
+    def get_instance(cls):
+        return cls()
+
+    def set_enabled(self, enabled: bool):
+        self.enabled = enabled
+
+    def set_output(self, output):
+        # None prints to sys.stdout
+        self.output = output
+
+    def log(self, message: str):
+        # Once the printer is CAPACITY lines behind, new lines are dropped rather than making bidders wait
+        if self.enabled:
+            try:
+                self.queue.put_nowait(message)
+            except Full:
+                self.dropped += 1
+
+    def get_dropped_count(self) -> int:
+        return self.dropped
+
+    def flush(self):
+        self.queue.join()
+
+    def _run(self):
+        while True:
+            message = self.queue.get()
+            try:
+                print(message, file=self.output)
+            except OSError:
+                # A closed stdout must not leave flush() waiting forever
+                pass
+            finally:
+                self.queue.task_done()
+
+
+# Scheduled Task Class, a handle on one pending scheduler callback
+class ScheduledTask:
+    def __init__(self, deadline: float, callback: Callable[[], None]):
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+
+
+# Auction Scheduler Class
+class AuctionScheduler:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = super().__new__(cls)
+                    instance._init_scheduler()
+                    cls._instance = instance
+        return cls._instance
+
+    @classmethod
+    def get_instance(cls):
+        return cls()
+
+    def _init_scheduler(self):
+        # Heap of (deadline, sequence, task); extended or cancelled tasks leave stale entries that are skipped on pop
+        self.heap = []
+        self.stale = 0
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> ScheduledTask:
+        task = ScheduledTask(time.monotonic() + delay, callback)
+        with self.condition:
+            self._push(task)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="auction-scheduler", daemon=True)
+                self.thread.start()
+        return task
+
+    def reschedule(self, task: ScheduledTask, delay: float):
+        with self.condition:
+            if task.cancelled:
+                return
+            task.deadline = time.monotonic() + delay
+            self.stale += 1
+            self._push(task)
+            self._compact()
+
+    def cancel(self, task: ScheduledTask):
+        with self.condition:
+            if not task.cancelled:
+                task.cancelled = True
+                self.stale += 1
+                self._compact()
+
+    def get_pending_count(self) -> int:
+        with self.condition:
+            return len(self.heap)
+
+    def _push(self, task: ScheduledTask):
+        heapq.heappush(self.heap, (task.deadline, next(self.sequence), task))
+        # Only wake the thread when the new entry is the earliest deadline
+        if self.heap[0][2] is task:
+            self.condition.notify()
+
+    def _compact(self):
+        # Rebuild once stale entries make up half the heap so cancelled far-future deadlines do not pile up
+        if self.stale * 2 > len(self.heap):
+            self.heap = [entry for entry in self.heap if not entry[2].cancelled and entry[0] == entry[2].deadline]
+            heapq.heapify(self.heap)
+            self.stale = 0
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    deadline, _, task = self.heap[0]
+                    if task.cancelled or deadline != task.deadline:
+                        heapq.heappop(self.heap)
+                        self.stale -= 1
+                        continue
+                    delay = deadline - time.monotonic()
+                    if delay <= 0:
+                        heapq.heappop(self.heap)
+                        task.cancelled = True
+                        break
+                    self.condition.wait(delay)
+            try:
+                task.callback()
+            except Exception as e:
+                print(f"Scheduled task failed: {e}")
+
+
 # Auction Listing Class
 class AuctionListing:
-    def __init__(self, id: str, item_name: str, description: str, starting_price: float, duration: int, seller: User):
+    def __init__(self, id: str, item_name: str, description: str, starting_price: float, duration: int, seller: User,
+                 anti_sniping_window: float = 0.0, scheduler: Optional[AuctionScheduler] = None,
+                 min_increment: float = 1.0):
         self.id = id
         self.item_name = item_name
         self.description = description
@@ -45,34 +296,523 @@ class AuctionListing:
         self.status = AuctionStatus.ACTIVE
         self.current_highest_bid = starting_price
         self.current_highest_bidder: Optional[User] = None
-        self.bids: List[Bid] = []
+        self.bids = BidHistory()
+        self.observers = []
         self.lock = threading.Lock()
+        self.event_log = AuctionEventLog.get_instance()
+        # Rejections are only counted on the hot path; next() on a count is atomic, so no lock is needed
+        self.rejected_bids = itertools.count()
+        # Proxy bids: max-heap of (-max_amount, sequence, bidder_id), one live entry per bidder in proxy_limits
+        self.min_increment = min_increment
+        self.proxies = []
+        self.proxy_limits = {}
+        self.proxy_bidders = {}
+        self.proxy_sequence = itertools.count()
+        self.end_time = time.time() + duration
+        # Bids landing this close to the end push the deadline back by the same window
+        self.anti_sniping_window = anti_sniping_window
 
-        # Start a timer to automatically close the auction after the specified duration
-        threading.Timer(self.duration, self.close_auction).start()
+        # Schedule the close on the shared scheduler thread instead of a timer thread per listing
+        self.scheduler = scheduler if scheduler is not None else AuctionScheduler.get_instance()
+        self.close_task = self.scheduler.schedule(self.duration, self.close_auction)
 
-    def place_bid(self, bid: Bid):
+    def place_bid(self, bid: Bid) -> bool:
+        # Fast path: the high bid only ever rises and is published under the lock, so a bid that does not beat the
+        # value read here cannot win and is rejected without touching the lock
+        if self.status != AuctionStatus.ACTIVE or bid.amount <= self.current_highest_bid:
+            self._count_rejected()
+            return False
         with self.lock:
-            if self.status == AuctionStatus.ACTIVE and bid.amount > self.current_highest_bid:
-                self.current_highest_bid = bid.amount
-                self.current_highest_bidder = bid.bidder
-                self.bids.append(bid)
-                self.notify_observers()
-                print(f"Bid placed: {bid.amount} by {bid.bidder.username} for {self.item_name}")
-            else:
-                print(f"Bid rejected: {bid.amount} by {bid.bidder.username} for {self.item_name}")
+            if self.status != AuctionStatus.ACTIVE or bid.amount <= self.current_highest_bid:
+                self._count_rejected()
+                return False
+            self._commit_bid(bid)
+            if self.proxies:
+                self._resolve_proxies()
+        return True
+
+    def register_proxy(self, bidder: User, max_amount: float) -> bool:
+        # Re-registering replaces the bidder's previous limit; the old heap entry goes stale
+        with self.lock:
+            leading = self.current_highest_bidder is not None and self.current_highest_bidder.id == bidder.id
+            if self.status != AuctionStatus.ACTIVE or (max_amount <= self.current_highest_bid and not leading):
+                self.event_log.log(f"Proxy rejected: {max_amount} by {bidder.username} for {self.item_name}")
+                return False
+            entry = (-max_amount, next(self.proxy_sequence), bidder.id)
+            self.proxy_limits[bidder.id] = entry
+            self.proxy_bidders[bidder.id] = bidder
+            heapq.heappush(self.proxies, entry)
+            self._resolve_proxies()
+        return True
+
+    def _commit_bid(self, bid: Bid):
+        self.current_highest_bid = bid.amount
+        self.current_highest_bidder = bid.bidder
+        self.bids.append(bid)
+        if self.anti_sniping_window and self.end_time - time.time() < self.anti_sniping_window:
+            self._extend(self.anti_sniping_window - (self.end_time - time.time()))
+        self.notify_observers()
+        self.event_log.log(f"Bid placed: {bid.amount} by {bid.bidder.username} for {self.item_name}")
+
+    def _top_proxy(self):
+        while self.proxies and self.proxy_limits.get(self.proxies[0][2]) is not self.proxies[0]:
+            heapq.heappop(self.proxies)
+        return self.proxies[0] if self.proxies else None
+
+    def _resolve_proxies(self):
+        # Only the two highest limits matter: the top proxy wins at one increment over the runner-up (or the
+        # current bid), capped at its own limit, so a bid war settles in one step
+        top = self._top_proxy()
+        if top is None:
+            return
+        heapq.heappop(self.proxies)
+        runner_up = self._top_proxy()
+        heapq.heappush(self.proxies, top)
+        limit = -top[0]
+        bidder = self.proxy_bidders[top[2]]
+        leading = self.current_highest_bidder is not None and self.current_highest_bidder.id == bidder.id
+        price = self.current_highest_bid if leading else self.current_highest_bid + self.min_increment
+        if runner_up is not None:
+            price = max(price, -runner_up[0] + self.min_increment)
+        price = min(price, limit)
+        if price > self.current_highest_bid:
+            self._commit_bid(Bid(f"{self.id}-proxy-{next(self.proxy_sequence)}", bidder, price))
+
+    def _count_rejected(self):
+        next(self.rejected_bids)
 
+    def _log_rejected_summary(self):
+        # Reading the count advances it by one, so the value returned is the number of rejections so far
+        rejected = next(self.rejected_bids)
+        if rejected:
+            self.event_log.log(f"Bids rejected: {rejected} for {self.item_name}")
 
     def close_auction(self):
         with self.lock:
             if self.status == AuctionStatus.ACTIVE:
                 self.status = AuctionStatus.CLOSED
+                self.scheduler.cancel(self.close_task)
+                self.notify_observers()
+                self._log_rejected_summary()
+
+    def extend_auction(self, seconds: float):
+        with self.lock:
+            if self.status == AuctionStatus.ACTIVE:
+                self._extend(seconds)
+                self.notify_observers()
+
+    def cancel_auction(self):
+        with self.lock:
+            if self.status == AuctionStatus.ACTIVE:
+                self.status = AuctionStatus.CANCELLED
+                self.scheduler.cancel(self.close_task)
                 self.notify_observers()
+                self._log_rejected_summary()
+
+    def _extend(self, seconds: float):
+        self.end_time += seconds
+        self.scheduler.reschedule(self.close_task, self.end_time - time.time())
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
 
     def notify_observers(self):
-        pass
+        for observer in self.observers:
+            observer.on_listing_update(self)
 
     
+# Auction Event Class, what a watcher receives about one listing
+class AuctionEvent:
+    def __init__(self, listing_id: str, event_type: AuctionEventType, amount: float, bidder_id: Optional[str],
+                 status: AuctionStatus):
+        self.listing_id = listing_id
+        self.event_type = event_type
+        self.amount = amount
+        self.bidder_id = bidder_id
+        self.status = status
+
+
+# Auction Watcher Class, base class for subscribers to listing events
+class AuctionWatcher:
+    def __init__(self, user: User):
+        self.user = user
+
+    def on_auction_event(self, event: AuctionEvent):
+        pass
+
+
+# Watcher Slot Class, the latest undelivered events of one listing for one watcher
+class WatcherSlot:
+    def __init__(self, feed: 'ListingFeed', watcher: AuctionWatcher):
+        self.feed = feed
+        self.watcher = watcher
+        # (price update or closed event, outbid event) of the newest round not yet handed to the watcher
+        self.events = None
+        # Sticky until delivered, so a coalesced round cannot hide that the watcher lost the lead
+        self.outbid = False
+        self.scheduled = False
+        self.lock = threading.Lock()
+
+    def offer(self, events, outbid: bool) -> bool:
+        # Returns True when the slot has to be queued for delivery; a queued slot just takes the newer events
+        with self.lock:
+            self.events = events
+            self.outbid = self.outbid or outbid
+            if self.scheduled:
+                return False
+            self.scheduled = True
+            return True
+
+    def take(self) -> AuctionEvent:
+        with self.lock:
+            (event, outbid_event), outbid = self.events, self.outbid
+            self.events = None
+            self.outbid = False
+        return outbid_event if outbid and event.bidder_id != self.watcher.user.id else event
+
+    def finish(self) -> bool:
+        # Returns True when newer events arrived while the watcher was being called
+        with self.lock:
+            if self.events is None:
+                self.scheduled = False
+                return False
+            return True
+
+
+# Listing Feed Class, the latest versioned snapshot of one watched listing
+class ListingFeed:
+    def __init__(self, listing_id: str):
+        self.listing_id = listing_id
+        self.version = 0
+        self.delivered_version = 0
+        self.snapshot = None
+        self.leader = None
+        # Users who lost the lead since the last delivery round
+        self.outbid = set()
+        self.watchers = {}
+        self.watcher_list = ()
+        self.watchers_changed = False
+        self.scheduled = False
+        # Earliest time.monotonic() at which the next delivery round may run
+        self.not_before = 0.0
+        # CPU seconds the watchers' callbacks took since the last round, guarded by the hub's stats lock
+        self.callback_time = 0.0
+        self.lock = threading.Lock()
+
+    def add_watcher(self, watcher: AuctionWatcher):
+        with self.lock:
+            if watcher not in self.watchers:
+                self.watchers[watcher] = WatcherSlot(self, watcher)
+                self.watchers_changed = True
+
+    def remove_watcher(self, watcher: AuctionWatcher):
+        with self.lock:
+            if watcher in self.watchers:
+                del self.watchers[watcher]
+                self.watchers_changed = True
+
+    def publish(self, amount: float, bidder_id: Optional[str], status: AuctionStatus) -> bool:
+        # O(1) whatever the watcher count; returns True when a delivery round has to be scheduled
+        with self.lock:
+            if self.leader is not None and self.leader != bidder_id:
+                self.outbid.add(self.leader)
+            self.leader = bidder_id
+            self.version += 1
+            self.snapshot = (amount, bidder_id, status)
+            if self.scheduled:
+                return False
+            self.scheduled = True
+            return True
+
+    def take(self):
+        # Everything published since the last round, coalesced into the latest snapshot
+        with self.lock:
+            if self.watchers_changed:
+                self.watcher_list = tuple(self.watchers.values())
+                self.watchers_changed = False
+            outbid, self.outbid = self.outbid, set()
+            skipped = self.version - self.delivered_version - 1
+            self.delivered_version = self.version
+            return self.snapshot, outbid, self.watcher_list, skipped
+
+    def finish(self) -> bool:
+        # Returns True when more updates were published during the round
+        with self.lock:
+            if self.version == self.delivered_version:
+                self.scheduled = False
+                return False
+            return True
+
+
+# Watcher Hub Class
+class WatcherHub:
+    def __init__(self, num_workers: int = 4, min_interval: float = 0.05, max_delivery_share: float = 0.05):
+        # A busy listing gets a round at most every min_interval seconds, and never spends more than
+        # max_delivery_share of the time delivering, so large watcher sets cannot starve bidders
+        self.min_interval = min_interval
+        self.max_delivery_share = max_delivery_share
+        self.feeds = {}
+        self.lock = threading.Lock()
+        self.scheduler = AuctionScheduler.get_instance()
+        # Feeds due a round, and deques of watcher slots due a callback that every worker taking one drains
+        self.ready = SimpleQueue()
+        self.rounds = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.stats_lock = threading.Lock()
+        self.workers = [threading.Thread(target=self._deliver, name=f"watcher-worker-{i}", daemon=True)
+                        for i in range(num_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def subscribe(self, listing: AuctionListing, watcher: AuctionWatcher):
+        with self.lock:
+            feed = self.feeds.get(listing.id)
+            if feed is None:
+                feed = self.feeds[listing.id] = ListingFeed(listing.id)
+                listing.add_observer(self)
+            feed.add_watcher(watcher)
+
+    def unsubscribe(self, listing: AuctionListing, watcher: AuctionWatcher):
+        with self.lock:
+            feed = self.feeds.get(listing.id)
+            if feed is not None:
+                feed.remove_watcher(watcher)
+
+    def get_stats(self) -> dict:
+        with self.stats_lock:
+            return {"rounds": self.rounds, "delivered": self.delivered, "coalesced": self.coalesced}
+
+    def on_listing_update(self, listing: AuctionListing):
+        # Called under the listing lock: the bid only replaces the feed's snapshot, delivery is pulled later
+        feed = self.feeds.get(listing.id)
+        if feed is None:
+            return
+        bidder = listing.current_highest_bidder
+        if feed.publish(listing.current_highest_bid, bidder.id if bidder is not None else None, listing.status):
+            self.ready.put(feed)
+
+    def _deliver(self):
+        while True:
+            feed = self.ready.get()
+            if isinstance(feed, deque):
+                self._notify(feed)
+                continue
+            wait = feed.not_before - time.monotonic()
+            if wait > 0:
+                # Queued by a bid right after the last round; it runs once the pacing interval is over
+                self.scheduler.schedule(wait, lambda feed=feed: self.ready.put(feed))
+                continue
+            started = time.monotonic()
+            (amount, bidder_id, status), outbid, watchers, skipped = feed.take()
+            outbid.discard(bidder_id)
+            if status != AuctionStatus.ACTIVE:
+                event = outbid_event = AuctionEvent(feed.listing_id, AuctionEventType.CLOSED, amount, bidder_id, status)
+            else:
+                event = AuctionEvent(feed.listing_id, AuctionEventType.PRICE_UPDATE, amount, bidder_id, status)
+                outbid_event = AuctionEvent(feed.listing_id, AuctionEventType.OUTBID, amount, bidder_id, status)
+            # The round only fills each watcher's slot. The due slots are shared by several workers, so a slow watcher
+            # holds up one worker and its own later events, never the other watchers of the listing
+            events = (event, outbid_event)
+            due = deque(slot for slot in watchers if slot.offer(events, bool(outbid) and slot.watcher.user.id in outbid))
+            for _ in range(min(len(self.workers), len(due))):
+                self.ready.put(due)
+            elapsed = time.monotonic() - started
+            with self.stats_lock:
+                self.rounds += 1
+                self.coalesced += skipped
+                # Callbacks run after their round, so the pacing charges them to the next one
+                elapsed += feed.callback_time
+                feed.callback_time = 0.0
+            if status != AuctionStatus.ACTIVE:
+                # Closed listings publish nothing more; the feed stays scheduled so nothing re-queues it
+                with self.lock:
+                    if self.feeds.get(feed.listing_id) is feed:
+                        del self.feeds[feed.listing_id]
+                continue
+            delay = max(self.min_interval, elapsed * (1 - self.max_delivery_share) / self.max_delivery_share)
+            feed.not_before = started + elapsed + delay
+            if feed.finish():
+                self.scheduler.schedule(delay, lambda feed=feed: self.ready.put(feed))
+
+    def _notify(self, due: deque):
+        # Everything offered since a slot's last callback is coalesced into the newest events. Only CPU time counts
+        # against the delivery share: a watcher blocked on I/O does not slow down the listing's rounds
+        started = time.thread_time()
+        delivered = 0
+        feed = None
+        while True:
+            try:
+                slot = due.popleft()
+            except IndexError:
+                break
+            try:
+                slot.watcher.on_auction_event(slot.take())
+            except Exception as e:
+                print(f"Watcher delivery failed: {e}")
+            delivered += 1
+            feed = slot.feed
+            if slot.finish():
+                # Newer events arrived during the callback; the other workers may be done with this round already
+                self.ready.put(deque([slot]))
+        if feed is None:
+            return
+        elapsed = time.thread_time() - started
+        with self.stats_lock:
+            self.delivered += delivered
+            feed.callback_time += elapsed
+
+
+# Listing Search Index Class
+class ListingSearchIndex:
+    MIN_TERM_LENGTH = 3
+
+    def __init__(self):
+        # Trigram -> ids of active listings whose item name or description contains it
+        self.postings = {}
+        self.texts = {}
+        self.listings = {}
+        self.lock = threading.Lock()
+
+    def add(self, listing: AuctionListing):
+        # Fields are joined by a newline, which never appears in a search term, so no trigram matches across them
+        text = f"{listing.item_name}\n{listing.description}".lower()
+        with self.lock:
+            if listing.id in self.listings:
+                return
+            self.listings[listing.id] = listing
+            self.texts[listing.id] = text
+            for trigram in self._trigrams(text):
+                self.postings.setdefault(trigram, set()).add(listing.id)
+
+    def remove(self, listing: AuctionListing):
+        with self.lock:
+            text = self.texts.pop(listing.id, None)
+            if text is None:
+                return
+            del self.listings[listing.id]
+            for trigram in self._trigrams(text):
+                ids = self.postings.get(trigram)
+                if ids is not None:
+                    ids.discard(listing.id)
+                    if not ids:
+                        del self.postings[trigram]
+
+    def on_listing_update(self, listing: AuctionListing):
+        if listing.status != AuctionStatus.ACTIVE:
+            self.remove(listing)
+
+    def search(self, query: str, order: SearchOrder = SearchOrder.ENDING_SOON,
+               limit: Optional[int] = None) -> List[AuctionListing]:
+        # Every whitespace-separated term must appear as a substring; long terms narrow via postings first
+        terms = sorted(set(query.lower().split()), key=len, reverse=True)
+        with self.lock:
+            candidates = None
+            for term in terms:
+                if len(term) >= self.MIN_TERM_LENGTH:
+                    posting_sets = []
+                    for trigram in self._trigrams(term):
+                        ids = self.postings.get(trigram)
+                        if ids is None:
+                            return []
+                        posting_sets.append(ids)
+                    posting_sets.sort(key=len)
+                    matches = set(posting_sets[0]) if candidates is None else candidates & posting_sets[0]
+                    for ids in posting_sets[1:]:
+                        if not matches:
+                            break
+                        matches &= ids
+                else:
+                    # Terms shorter than a trigram fall back to scanning the current candidates
+                    matches = set(self.texts) if candidates is None else candidates
+                if len(term) == self.MIN_TERM_LENGTH:
+                    candidates = matches
+                else:
+                    # Trigrams can match out of order, so confirm the substring
+                    candidates = {listing_id for listing_id in matches if term in self.texts[listing_id]}
+                if not candidates:
+                    return []
+            listings = [self.listings[listing_id] for listing_id in
+                        (candidates if candidates is not None else self.listings)]
+        if order == SearchOrder.HIGHEST_BID:
+            key = lambda listing: -listing.current_highest_bid
+        else:
+            key = lambda listing: listing.end_time
+        if limit is not None:
+            return heapq.nsmallest(limit, listings, key=key)
+        return sorted(listings, key=key)
+
+    @staticmethod
+    def _trigrams(text: str):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# Ending Soon Index Class
+class EndingSoonIndex:
+    def __init__(self):
+        # Sorted (end_time, listing_id) of active listings; end_times holds each listing's current key
+        self.entries = []
+        self.end_times = {}
+        self.listings = {}
+        self.lock = threading.Lock()
+
+    def add(self, listing: AuctionListing):
+        with self.lock:
+            if listing.id not in self.end_times:
+                self._insert(listing)
+
+    def remove(self, listing: AuctionListing):
+        with self.lock:
+            if listing.id in self.end_times:
+                self._delete(listing.id)
+
+    def on_listing_update(self, listing: AuctionListing):
+        # Runs under the listing lock on every accepted bid; most bids neither close nor extend the listing, and a
+        # single dict read tells so without taking the index-wide lock
+        indexed_end_time = self.end_times.get(listing.id)
+        if listing.status == AuctionStatus.ACTIVE:
+            if indexed_end_time == listing.end_time:
+                return
+        elif indexed_end_time is None:
+            return
+        with self.lock:
+            if listing.status != AuctionStatus.ACTIVE:
+                if listing.id in self.end_times:
+                    self._delete(listing.id)
+            elif self.end_times.get(listing.id) != listing.end_time:
+                # Extended (anti-sniping or explicit): move the entry to its new close time
+                if listing.id in self.end_times:
+                    self._delete(listing.id)
+                self._insert(listing)
+
+    def get_ending_between(self, start_time: float, end_time: float, cursor: Optional[tuple] = None,
+                           limit: int = 50):
+        # Returns (listings, next_cursor); the cursor is the (end_time, listing_id) of the last listing returned
+        with self.lock:
+            low = bisect.bisect_left(self.entries, (start_time,))
+            if cursor is not None:
+                low = max(low, bisect.bisect_right(self.entries, cursor))
+            high = bisect.bisect_left(self.entries, (end_time,), low)
+            page = self.entries[low:min(high, low + limit)]
+            listings = [self.listings[listing_id] for _, listing_id in page]
+            next_cursor = page[-1] if page and low + limit < high else None
+        return listings, next_cursor
+
+    def get_ending_soonest(self, k: int) -> List[AuctionListing]:
+        with self.lock:
+            return [self.listings[listing_id] for _, listing_id in self.entries[:k]]
+
+    def _insert(self, listing: AuctionListing):
+        self.end_times[listing.id] = listing.end_time
+        self.listings[listing.id] = listing
+        bisect.insort(self.entries, (listing.end_time, listing.id))
+
+    def _delete(self, listing_id: str):
+        key = (self.end_times.pop(listing_id), listing_id)
+        del self.listings[listing_id]
+        del self.entries[bisect.bisect_left(self.entries, key)]
+
+
 # Auction System Class
 class AuctionSystem:
     _instance = None
@@ -82,6 +822,10 @@ class AuctionSystem:
             cls._instance = super().__new__(cls)
             cls._instance.users = {}
             cls._instance.auction_listings = {}
+            cls._instance.search_index = ListingSearchIndex()
+            cls._instance.ending_index = EndingSoonIndex()
+            cls._instance.watcher_hub = None
+            cls._instance.watcher_hub_lock = threading.Lock()
         return cls._instance
 
     @classmethod
@@ -93,14 +837,220 @@ class AuctionSystem:
 
     def create_auction_listing(self, listing: AuctionListing):
         self.auction_listings[listing.id] = listing
+        listing.add_observer(self.search_index)
+        listing.add_observer(self.ending_index)
+        if listing.status == AuctionStatus.ACTIVE:
+            self.search_index.add(listing)
+            self.ending_index.add(listing)
+
+    def search_auction_listings(self, keyword: str, order: SearchOrder = SearchOrder.ENDING_SOON,
+                                limit: Optional[int] = None) -> List[AuctionListing]:
+        return self.search_index.search(keyword, order, limit)
+
+    def get_ending_soon(self, within_seconds: float, cursor: Optional[tuple] = None, limit: int = 50):
+        now = time.time()
+        return self.ending_index.get_ending_between(now, now + within_seconds, cursor, limit)
+
+    def get_ending_soonest(self, k: int) -> List[AuctionListing]:
+        return self.ending_index.get_ending_soonest(k)
+
+    def place_bid(self, listing_id: str, bid: Bid) -> bool:
+        listing = self.auction_listings.get(listing_id)
+        if listing:
+            return listing.place_bid(bid)
+        return False
 
-    def search_auction_listings(self, keyword: str) -> List[AuctionListing]:
-        return [listing for listing in self.auction_listings.values() if keyword.lower() in listing.item_name.lower()]
+    def get_watcher_hub(self) -> WatcherHub:
+        with self.watcher_hub_lock:
+            if self.watcher_hub is None:
+                self.watcher_hub = WatcherHub()
+        return self.watcher_hub
+
+    def watch_listing(self, listing_id: str, watcher: AuctionWatcher) -> bool:
+        listing = self.auction_listings.get(listing_id)
+        if listing:
+            self.get_watcher_hub().subscribe(listing, watcher)
+            return True
+        return False
+
+    def unwatch_listing(self, listing_id: str, watcher: AuctionWatcher):
+        listing = self.auction_listings.get(listing_id)
+        if listing and self.watcher_hub is not None:
+            self.watcher_hub.unsubscribe(listing, watcher)
+
+    def get_bid_history(self, listing_id: str, cursor: Optional[int] = None, limit: int = 50):
+        listing = self.auction_listings.get(listing_id)
+        if listing:
+            with listing.lock:
+                return listing.bids.get_page(cursor, limit)
+        return [], None
+
+    def get_user_bids(self, listing_id: str, user_id: str) -> List[Bid]:
+        listing = self.auction_listings.get(listing_id)
+        if listing:
+            with listing.lock:
+                return listing.bids.get_bids_by_user(user_id)
+        return []
 
-    def place_bid(self, listing_id: str, bid: Bid):
+    def place_proxy_bid(self, listing_id: str, bidder: User, max_amount: float) -> bool:
         listing = self.auction_listings.get(listing_id)
         if listing:
-            listing.place_bid(bid)
+            return listing.register_proxy(bidder, max_amount)
+        return False
+
+
+# Listing Summary Class, the picklable view of a listing returned by shards
+class ListingSummary:
+    def __init__(self, listing_id: str, item_name: str, current_highest_bid: float, end_time: float,
+                 status: AuctionStatus):
+        self.id = listing_id
+        self.item_name = item_name
+        self.current_highest_bid = current_highest_bid
+        self.end_time = end_time
+        self.status = status
+
+
+# Auction Shard Class, the command loop of one shard process around its own AuctionSystem
+class AuctionShard:
+    @staticmethod
+    def serve(connection, log_enabled: bool):
+        AuctionEventLog.get_instance().set_enabled(log_enabled)
+        auction_system = AuctionSystem.get_instance()
+        while True:
+            command, args = connection.recv()
+            if command == ShardCommand.STOP:
+                connection.send(None)
+                break
+            if command == ShardCommand.BATCH:
+                # Items before a failing one are already committed, so every item reports on its own
+                result = [AuctionShard.handle_safely(auction_system, *item) for item in args[0]]
+            else:
+                result = AuctionShard.handle_safely(auction_system, command, args)
+            connection.send(result)
+        connection.close()
+
+    @staticmethod
+    def handle_safely(auction_system, command: ShardCommand, args):
+        try:
+            return AuctionShard.handle(auction_system, command, args)
+        except Exception as e:
+            return e
+
+    @staticmethod
+    def handle(auction_system, command: ShardCommand, args):
+        if command == ShardCommand.PLACE_BID:
+            listing_id, bid_id, bidder_id, amount = args
+            bidder = auction_system.users.get(bidder_id)
+            if bidder is None:
+                return False
+            return auction_system.place_bid(listing_id, Bid(bid_id, bidder, amount))
+        if command == ShardCommand.SEARCH:
+            keyword, order, limit = args
+            return [ListingSummary(listing.id, listing.item_name, listing.current_highest_bid, listing.end_time,
+                                   listing.status)
+                    for listing in auction_system.search_auction_listings(keyword, order, limit)]
+        if command == ShardCommand.CREATE_LISTING:
+            listing_id, item_name, description, starting_price, duration, seller_id = args
+            auction_system.create_auction_listing(AuctionListing(listing_id, item_name, description, starting_price,
+                                                                 duration, auction_system.users[seller_id]))
+            return True
+        if command == ShardCommand.REGISTER_USER:
+            auction_system.register_user(User(*args))
+            return True
+        raise ValueError(f"Unknown shard command {command}")
+
+
+# Sharded Auction System Class, routes listings to shard processes by crc32 of the listing id
+class ShardedAuctionSystem:
+    def __init__(self, num_shards: int = 4, log_enabled: bool = True):
+        # Spawned rather than forked so shards never inherit the router's scheduler or logger threads mid-flight
+        context = multiprocessing.get_context("spawn")
+        self.num_shards = num_shards
+        self.connections = []
+        self.locks = []
+        self.processes = []
+        for i in range(num_shards):
+            parent, child = context.Pipe()
+            process = context.Process(target=AuctionShard.serve, args=(child, log_enabled),
+                                      name=f"auction-shard-{i}", daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.locks.append(threading.Lock())
+            self.processes.append(process)
+
+    def get_shard(self, listing_id: str) -> int:
+        return zlib.crc32(listing_id.encode()) % self.num_shards
+
+    def register_user(self, user: User):
+        # Users are replicated to every shard so bids and listings can refer to them by id
+        self._scatter({shard: (ShardCommand.REGISTER_USER, (user.id, user.username, user.email))
+                       for shard in range(self.num_shards)})
+
+    def create_auction_listing(self, listing_id: str, item_name: str, description: str, starting_price: float,
+                               duration: int, seller: User):
+        return self._call(self.get_shard(listing_id), ShardCommand.CREATE_LISTING,
+                          (listing_id, item_name, description, starting_price, duration, seller.id))
+
+    def place_bid(self, listing_id: str, bid: Bid) -> bool:
+        return self._call(self.get_shard(listing_id), ShardCommand.PLACE_BID,
+                          (listing_id, bid.id, bid.bidder.id, bid.amount))
+
+    def place_bids(self, bids: List[Tuple[str, Bid]]) -> List[Union[bool, Exception]]:
+        # One batch message per shard, all shards working in parallel; results come back in input order, and a bid
+        # that raised on its shard comes back as that exception in its position without affecting the others
+        batches = {}
+        positions = {}
+        for position, (listing_id, bid) in enumerate(bids):
+            shard = self.get_shard(listing_id)
+            batches.setdefault(shard, []).append((ShardCommand.PLACE_BID, (listing_id, bid.id, bid.bidder.id,
+                                                                           bid.amount)))
+            positions.setdefault(shard, []).append(position)
+        replies = self._scatter({shard: (ShardCommand.BATCH, (batch,)) for shard, batch in batches.items()})
+        results = [False] * len(bids)
+        for shard, shard_results in replies.items():
+            for position, result in zip(positions[shard], shard_results):
+                results[position] = result
+        return results
+
+    def search_auction_listings(self, keyword: str, order: SearchOrder = SearchOrder.ENDING_SOON,
+                                limit: Optional[int] = None) -> List[ListingSummary]:
+        replies = self._scatter({shard: (ShardCommand.SEARCH, (keyword, order, limit))
+                                 for shard in range(self.num_shards)})
+        if order == SearchOrder.HIGHEST_BID:
+            key = lambda listing: -listing.current_highest_bid
+        else:
+            key = lambda listing: listing.end_time
+        # Every shard returns its results already ranked, so a k-way merge is enough
+        merged = heapq.merge(*replies.values(), key=key)
+        return list(itertools.islice(merged, limit)) if limit is not None else list(merged)
+
+    def shutdown(self):
+        self._scatter({shard: (ShardCommand.STOP, ()) for shard in range(self.num_shards)})
+        for process in self.processes:
+            process.join()
+        for connection in self.connections:
+            connection.close()
+
+    def _call(self, shard: int, command: ShardCommand, args):
+        return self._scatter({shard: (command, args)})[shard]
+
+    def _scatter(self, requests):
+        # Shard locks are taken in shard order so concurrent scatters cannot deadlock
+        shards = sorted(requests)
+        for shard in shards:
+            self.locks[shard].acquire()
+        try:
+            for shard in shards:
+                self.connections[shard].send(requests[shard])
+            replies = {shard: self.connections[shard].recv() for shard in shards}
+        finally:
+            for shard in reversed(shards):
+                self.locks[shard].release()
+        for reply in replies.values():
+            if isinstance(reply, Exception):
+                raise reply
+        return replies
 
 
 # -------------------------------
@@ -134,6 +1084,152 @@ class AuctionSystemDemo:
         bid2 = Bid("2", user1, 200.0)
         auction_system.place_bid(listing1.id, bid1)
         auction_system.place_bid(listing1.id, bid2)
+        AuctionEventLog.get_instance().flush()
+
+
+# -------------------------------
+# Auction Scheduler Benchmark Class
+# -------------------------------
+class AuctionSchedulerBenchmark:
+    @staticmethod
+    def run(listing_counts=(1000, 10000, 100000), duration=3600):
+        seller = User("bench", "Benchmark Seller", "bench@example.com")
+        scheduler = AuctionScheduler.get_instance()
+        for count in listing_counts:
+            tracemalloc.start()
+            start = time.perf_counter()
+            listings = [AuctionListing(f"bench-{count}-{i}", f"Item {i}", "Benchmark item", 1.0, duration, seller)
+                        for i in range(count)]
+            elapsed = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{count:>7} listings: {threading.active_count()} threads, {current / count:.0f} bytes/listing, "
+                  f"peak {peak / 2 ** 20:.1f} MiB, {count / elapsed:.0f} listings/sec")
+            for listing in listings:
+                listing.cancel_auction()
+        print(f"pending scheduler entries after cancel: {scheduler.get_pending_count()}")
+
+
+# -------------------------------
+# Bid Storm Benchmark Class
+# -------------------------------
+class BidStormBenchmark:
+    @staticmethod
+    def run(num_threads=8, bids_per_thread=50000, num_listings=4):
+        # Logging stays on so its cost is measured; the lines go to devnull instead of the console
+        event_log = AuctionEventLog.get_instance()
+        event_log.flush()
+        devnull = open(os.devnull, "w")
+        event_log.set_output(devnull)
+        dropped = event_log.get_dropped_count()
+        seller = User("storm-seller", "Storm Seller", "storm@example.com")
+        listings = [AuctionListing(f"storm-{i}", f"Storm {i}", "Bid storm item", 1.0, 3600, seller)
+                    for i in range(num_listings)]
+        counts = [[0, 0] for _ in range(num_threads)]
+
+        def bidder(thread_index):
+            user = User(f"storm-{thread_index}", f"Bidder {thread_index}", "bidder@example.com")
+            count = counts[thread_index]
+            for i in range(bids_per_thread):
+                listing = listings[i % num_listings]
+                # Mostly losing bids just under the current high, with an occasional raise
+                amount = listing.current_highest_bid + (1.0 if i % 50 == thread_index else -1.0)
+                if listing.place_bid(Bid(f"{thread_index}-{i}", user, amount)):
+                    count[0] += 1
+                else:
+                    count[1] += 1
+
+        threads = [threading.Thread(target=bidder, args=(i,)) for i in range(num_threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        accepted = sum(count[0] for count in counts)
+        rejected = sum(count[1] for count in counts)
+        for listing in listings:
+            listing.cancel_auction()
+        event_log.flush()
+        event_log.set_output(None)
+        devnull.close()
+        print(f"{accepted + rejected} bids in {elapsed:.2f}s: {accepted / elapsed:.0f} accepted/sec, "
+              f"{rejected / elapsed:.0f} rejected/sec, {event_log.get_dropped_count() - dropped} log lines dropped")
+
+
+# -------------------------------
+# Watcher Fan-out Benchmark Class
+# -------------------------------
+class WatcherFanoutBenchmark:
+    @staticmethod
+    def run(watcher_counts=(0, 20000, 50000), num_bids=200000):
+        AuctionEventLog.get_instance().set_enabled(False)
+        seller = User("fanout-seller", "Fanout Seller", "fanout@example.com")
+        bidders = [User(f"fanout-{i}", f"Bidder {i}", "bidder@example.com") for i in range(max(watcher_counts))]
+        hub = WatcherHub()
+        for num_watchers in watcher_counts:
+            listing = AuctionListing(f"fanout-{num_watchers}", "Fanout item", "Watched item", 1.0, 3600, seller)
+            for bidder in bidders[:num_watchers]:
+                hub.subscribe(listing, AuctionWatcher(bidder))
+            stats = hub.get_stats()
+            start = time.perf_counter()
+            for i in range(num_bids):
+                listing.place_bid(Bid(f"fanout-{i}", bidders[i % len(bidders)], 2.0 + i))
+            elapsed = time.perf_counter() - start
+            listing.cancel_auction()
+            # Let the closing round go out before reading the counters
+            time.sleep(0.5)
+            after = hub.get_stats()
+            print(f"{num_watchers:>6} watchers: {num_bids / elapsed:.0f} bids/sec accepted, "
+                  f"{after['rounds'] - stats['rounds']} rounds delivered {after['delivered'] - stats['delivered']} "
+                  f"events, {after['coalesced'] - stats['coalesced']} versions coalesced")
+        AuctionEventLog.get_instance().set_enabled(True)
+
+
+# -------------------------------
+# Bid History Benchmark Class
+# -------------------------------
+class BidHistoryBenchmark:
+    @staticmethod
+    def run(num_bids=1000000, num_bidders=1000):
+        bidders = [User(str(i), f"Bidder {i}", "bidder@example.com") for i in range(num_bidders)]
+        for columnar in (False, True):
+            tracemalloc.start()
+            history = BidHistory() if columnar else []
+            for i in range(num_bids):
+                history.append(Bid(str(i), bidders[i % num_bidders], 100.0 + i * 0.01))
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            label = "columnar" if columnar else "objects "
+            print(f"{label}: {current / num_bids:.0f} bytes/bid, {current / 2 ** 20:.1f} MiB for {num_bids} bids")
+            del history
+
+
+# -------------------------------
+# Sharded Auction Benchmark Class
+# -------------------------------
+class ShardedAuctionBenchmark:
+    @staticmethod
+    def run(shard_counts=(1, 2, 4), num_listings=1000, num_bids=200000, batch_size=1000, num_bidders=100):
+        for num_shards in shard_counts:
+            auction_system = ShardedAuctionSystem(num_shards, log_enabled=False)
+            seller = User("shard-seller", "Shard Seller", "seller@example.com")
+            bidders = [User(f"shard-{i}", f"Bidder {i}", "bidder@example.com") for i in range(num_bidders)]
+            for user in [seller] + bidders:
+                auction_system.register_user(user)
+            for i in range(num_listings):
+                auction_system.create_auction_listing(f"L{i}", f"Item {i}", "Sharded item", 1.0, 3600, seller)
+
+            bids = [(f"L{i % num_listings}", Bid(str(i), bidders[i % num_bidders], 2.0 + i // num_listings))
+                    for i in range(num_bids)]
+            accepted = 0
+            start = time.perf_counter()
+            for offset in range(0, num_bids, batch_size):
+                accepted += sum(auction_system.place_bids(bids[offset:offset + batch_size]))
+            elapsed = time.perf_counter() - start
+            auction_system.shutdown()
+            print(f"{num_shards} shards: {num_bids / elapsed:.0f} bids/sec ({accepted} accepted), "
+                  f"batch size {batch_size}, {multiprocessing.cpu_count()} CPUs")
 
 
 # -------------------------------
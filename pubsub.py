@@ -1,19 +1,46 @@
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import mmap
+import multiprocessing
+import os
+import pickle
+import struct
+import tempfile
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import deque
+from enum import Enum
+from itertools import islice
+from multiprocessing import resource_tracker, shared_memory
+from threading import Condition, Lock, Thread
+from urllib.parse import quote
 
 # Message class
 class Message:
-    def __init__(self, content):
+    def __init__(self, content, key=None):
         self.content = content
+        # Consumer groups keep messages with the same key in order on one partition
+        self.key = key
 
     def get_content(self):
         return self.content
 
+    def get_key(self):
+        return self.key
+
 
 # Subscriber base class
 class Subscriber:
     def on_message(self, message):
         pass
 
+    def on_batch(self, messages):
+        # Subscribers that can take a whole batch at once override this
+        for message in messages:
+            self.on_message(message)
+
 
 # ConcreteSubscriber class
 class ConcreteSubscriber(Subscriber):
@@ -24,24 +51,635 @@ class ConcreteSubscriber(Subscriber):
         print(f"Subscriber {self.name} received message: {message.get_content()}")
 
 
+# Enum for what a full subscriber queue does with a new message
+class OverflowPolicy(Enum):
+    BLOCK = 1
+    DROP_OLDEST = 2
+    DROP_NEWEST = 3
+
+
+# SubscriberQueue class, a bounded queue with its own dispatcher thread for one subscriber
+class SubscriberQueue:
+    def __init__(self, subscriber, capacity=10000, overflow_policy=OverflowPolicy.DROP_OLDEST, batch_size=1000,
+                 batch_delay=0.0):
+        self.subscriber = subscriber
+        self.capacity = capacity
+        self.overflow_policy = overflow_policy
+        # A batch is handed over once it reaches batch_size or batch_delay seconds after its first message
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.items = deque()
+        self.lock = Lock()
+        self.not_empty = Condition(self.lock)
+        self.not_full = Condition(self.lock)
+        self.closed = False
+        self.dropped = 0
+        self.thread = Thread(target=self._dispatch, daemon=True)
+        self.thread.start()
+
+    def put(self, message):
+        # Only BLOCK ever makes the publisher wait, and only while someone drains the queue: without a subscriber
+        # a full queue drops the newest message like DROP_NEWEST
+        with self.lock:
+            if self.closed:
+                return False
+            if len(self.items) >= self.capacity:
+                if self.overflow_policy == OverflowPolicy.DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.overflow_policy == OverflowPolicy.DROP_OLDEST:
+                    self.items.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self.items) >= self.capacity and not self.closed and self.subscriber is not None:
+                        self.not_full.wait()
+                    if self.closed:
+                        return False
+                    if len(self.items) >= self.capacity:
+                        self.dropped += 1
+                        return False
+            self.items.append(message)
+            self.not_empty.notify()
+            return True
+
+    def put_many(self, messages):
+        # Same overflow rules as put, applied once per batch under a single lock acquisition
+        with self.lock:
+            if self.closed:
+                return 0
+            room = self.capacity - len(self.items)
+            if len(messages) <= room:
+                self.items.extend(messages)
+                accepted = len(messages)
+            elif self.overflow_policy == OverflowPolicy.DROP_NEWEST:
+                self.items.extend(islice(messages, max(room, 0)))
+                accepted = max(room, 0)
+                self.dropped += len(messages) - accepted
+            elif self.overflow_policy == OverflowPolicy.DROP_OLDEST:
+                self.items.extend(messages)
+                accepted = len(messages)
+                overflow = len(self.items) - self.capacity
+                for _ in range(overflow):
+                    self.items.popleft()
+                self.dropped += overflow
+            else:
+                accepted = 0
+                while accepted < len(messages):
+                    while len(self.items) >= self.capacity and not self.closed and self.subscriber is not None:
+                        self.not_full.wait()
+                    if self.closed:
+                        break
+                    if len(self.items) >= self.capacity:
+                        self.dropped += len(messages) - accepted
+                        break
+                    room = self.capacity - len(self.items)
+                    self.items.extend(islice(messages, accepted, accepted + room))
+                    accepted = min(len(messages), accepted + room)
+                    self.not_empty.notify()
+            self.not_empty.notify()
+            return accepted
+
+    def get_dropped_count(self):
+        return self.dropped
+
+    def get_size(self):
+        return len(self.items)
+
+    def close(self):
+        # Messages already queued are still delivered before the dispatcher exits
+        with self.lock:
+            self.closed = True
+            self.not_empty.notify()
+            self.not_full.notify_all()
+
+    def join(self):
+        self.thread.join()
+
+    def set_subscriber(self, subscriber):
+        # The next batch goes to the new subscriber; a batch already handed over finishes on the old one.
+        # Publishers blocked on a full queue are woken so they stop waiting once nobody is left to drain it
+        with self.lock:
+            self.subscriber = subscriber
+            self.not_empty.notify()
+            self.not_full.notify_all()
+
+    def _dispatch(self):
+        while True:
+            with self.lock:
+                # Without a subscriber (an unassigned partition) messages wait in the queue
+                while (not self.items or self.subscriber is None) and not self.closed:
+                    self.not_empty.wait()
+                if not self.items or self.subscriber is None:
+                    return
+                if self.batch_delay > 0 and len(self.items) < self.batch_size:
+                    deadline = time.monotonic() + self.batch_delay
+                    while len(self.items) < self.batch_size and not self.closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.not_empty.wait(remaining)
+                batch = [self.items.popleft() for _ in range(min(len(self.items), self.batch_size))]
+                self.not_full.notify_all()
+                subscriber = self.subscriber
+            try:
+                subscriber.on_batch(batch)
+            except Exception as e:
+                print(f"Subscriber failed to handle message: {e}")
+
+
+# ConsumerGroup class splitting a topic into partitions that are each delivered to one member
+class ConsumerGroup:
+    def __init__(self, name, num_partitions=8, queue_capacity=10000, overflow_policy=OverflowPolicy.BLOCK,
+                 batch_size=1000):
+        self.name = name
+        self.num_partitions = num_partitions
+        # One queue and dispatcher thread per partition keeps every key's messages in order
+        self.partitions = [SubscriberQueue(None, queue_capacity, overflow_policy, batch_size)
+                           for _ in range(num_partitions)]
+        self.members = []
+        self.next_partition = 0
+        self.lock = Lock()
+
+    def join(self, member):
+        with self.lock:
+            if member not in self.members:
+                self.members.append(member)
+                self._rebalance()
+
+    def leave(self, member):
+        with self.lock:
+            if member in self.members:
+                self.members.remove(member)
+                self._rebalance()
+            return len(self.members)
+
+    def get_members(self):
+        return list(self.members)
+
+    def get_assignment(self):
+        return {partition: queue.subscriber for partition, queue in enumerate(self.partitions)}
+
+    def get_partition(self, message):
+        key = message.get_key()
+        if key is None:
+            # Keyless messages carry no ordering promise and are spread round-robin
+            self.next_partition = (self.next_partition + 1) % self.num_partitions
+            return self.next_partition
+        return zlib.crc32(key if isinstance(key, bytes) else str(key).encode()) % self.num_partitions
+
+    def put(self, message):
+        return self.partitions[self.get_partition(message)].put(message)
+
+    def put_many(self, messages):
+        batches = {}
+        for message in messages:
+            batches.setdefault(self.get_partition(message), []).append(message)
+        for partition, batch in batches.items():
+            self.partitions[partition].put_many(batch)
+
+    def close(self):
+        for queue in self.partitions:
+            queue.close()
+        for queue in self.partitions:
+            queue.join()
+
+    def _rebalance(self):
+        # Round-robin: partition i goes to member i mod n; with no members the partitions hold their messages
+        # up to queue_capacity and then drop the newest, so a memberless group never blocks the publisher
+        for partition, queue in enumerate(self.partitions):
+            queue.set_subscriber(self.members[partition % len(self.members)] if self.members else None)
+
+
 # Topic class
 class Topic:
     def __init__(self, name):
         self.name = name
-        self.subscribers = set()
+        # Subscriber -> its SubscriberQueue, or None for synchronous delivery on the publishing thread
+        self.direct_subscribers = {}
+        # Cache of everyone a message goes to: the direct subscribers, plus the routed ones once PubSubSystem sets
+        # a resolver; None when it has to be rebuilt
+        self.subscribers = None
+        self.resolver = None
+        # Optional TopicLog; messages are appended under the topic lock, so log order is delivery order
+        self.log = None
+        # Consumer group name -> ConsumerGroup; every group gets each message once
+        self.groups = {}
+        self.lock = Lock()
 
     def get_name(self):
         return self.name
 
-    def add_subscriber(self, subscriber):
-        self.subscribers.add(subscriber)
+    def add_subscriber(self, subscriber, queue=None):
+        with self.lock:
+            self.direct_subscribers[subscriber] = queue
+            self.invalidate()
 
     def remove_subscriber(self, subscriber):
-        self.subscribers.discard(subscriber)
+        with self.lock:
+            self.direct_subscribers.pop(subscriber, None)
+            self.invalidate()
+
+    def invalidate(self):
+        self.subscribers = None
+
+    def get_subscribers(self):
+        subscribers = self.subscribers
+        if subscribers is None:
+            if self.resolver is None:
+                subscribers = self.subscribers = dict(self.direct_subscribers)
+            else:
+                subscribers = self.resolver(self)
+        return subscribers
 
     def publish(self, message):
-        for subscriber in self.subscribers:
-            subscriber.on_message(message)
+        # Enqueueing under the topic lock gives every subscriber the same FIFO order per topic
+        with self.lock:
+            if self.log is not None:
+                self.log.append(message)
+            for subscriber, queue in self.get_subscribers().items():
+                if queue is None:
+                    subscriber.on_message(message)
+                else:
+                    queue.put(message)
+            for group in self.groups.values():
+                group.put(message)
+
+    def publish_many(self, messages):
+        with self.lock:
+            if self.log is not None:
+                self.log.append_many(messages)
+            for subscriber, queue in self.get_subscribers().items():
+                if queue is None:
+                    subscriber.on_batch(messages)
+                else:
+                    queue.put_many(messages)
+            for group in self.groups.values():
+                group.put_many(messages)
+
+    def add_group(self, group):
+        with self.lock:
+            return self.groups.setdefault(group.name, group)
+
+    def remove_group(self, group_name):
+        with self.lock:
+            return self.groups.pop(group_name, None)
+
+
+# TopicTrieNode class, one topic name segment in the subscription trie
+class TopicTrieNode:
+    def __init__(self):
+        self.children = {}
+        # Subscriber -> queue for the patterns that end at this node
+        self.subscribers = {}
+
+
+# TopicTrie class matching dotted topic names against subscription patterns
+class TopicTrie:
+    # "*" matches exactly one segment, "#" matches zero or more trailing segments
+    SEPARATOR = "."
+    SINGLE_WILDCARD = "*"
+    MULTI_WILDCARD = "#"
+
+    def __init__(self):
+        self.root = TopicTrieNode()
+
+    def add(self, pattern, subscriber, queue):
+        segments = self.validate(pattern)
+        node = self.root
+        for segment in segments:
+            node = node.children.setdefault(segment, TopicTrieNode())
+        added = subscriber not in node.subscribers
+        node.subscribers[subscriber] = queue
+        return added
+
+    def remove(self, pattern, subscriber):
+        path = [self.root]
+        for segment in pattern.split(self.SEPARATOR):
+            node = path[-1].children.get(segment)
+            if node is None:
+                return False
+            path.append(node)
+        if path[-1].subscribers.pop(subscriber, None) is None:
+            return False
+        # Prune the branch back up to the first node still in use
+        for parent, segment in zip(reversed(path[:-1]), reversed(pattern.split(self.SEPARATOR))):
+            node = parent.children[segment]
+            if node.subscribers or node.children:
+                break
+            del parent.children[segment]
+        return True
+
+    def match(self, topic_name):
+        # Only branches that can still match are visited, so the cost follows the matching subscriptions
+        subscribers = {}
+        self._match(self.root, topic_name.split(self.SEPARATOR), 0, subscribers)
+        return subscribers
+
+    def _match(self, node, segments, index, subscribers):
+        multi = node.children.get(self.MULTI_WILDCARD)
+        if multi is not None:
+            subscribers.update(multi.subscribers)
+        if index == len(segments):
+            subscribers.update(node.subscribers)
+            return
+        child = node.children.get(segments[index])
+        if child is not None:
+            self._match(child, segments, index + 1, subscribers)
+        single = node.children.get(self.SINGLE_WILDCARD)
+        if single is not None:
+            self._match(single, segments, index + 1, subscribers)
+
+    @staticmethod
+    def validate(pattern):
+        # Returns the pattern's segments
+        segments = pattern.split(TopicTrie.SEPARATOR)
+        if TopicTrie.MULTI_WILDCARD in segments[:-1]:
+            raise ValueError(f"'{TopicTrie.MULTI_WILDCARD}' is only allowed as the last segment: {pattern}")
+        return segments
+
+    @staticmethod
+    def is_pattern(name):
+        segments = name.split(TopicTrie.SEPARATOR)
+        return TopicTrie.SINGLE_WILDCARD in segments or TopicTrie.MULTI_WILDCARD in segments
+
+    @staticmethod
+    def matches(pattern, topic_name):
+        pattern_segments = pattern.split(TopicTrie.SEPARATOR)
+        topic_segments = topic_name.split(TopicTrie.SEPARATOR)
+        for index, segment in enumerate(pattern_segments):
+            if segment == TopicTrie.MULTI_WILDCARD:
+                return True
+            if index == len(topic_segments):
+                return False
+            if segment != TopicTrie.SINGLE_WILDCARD and segment != topic_segments[index]:
+                return False
+        return len(pattern_segments) == len(topic_segments)
+
+
+# TopicLog class, an append-only log of one topic split into size-rolled segment files
+class TopicLog:
+    FRAME = struct.Struct("<QIB")  # offset, payload length, encoding
+    INDEX_ENTRY = struct.Struct("<QQ")  # offset, position in the segment
+    RAW = 0
+    PICKLED = 1
+
+    def __init__(self, directory, segment_bytes=64 * 2 ** 20, index_interval=4096, fsync=False):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.index_interval = index_interval
+        self.fsync = fsync
+        # Per segment base offset: sparse (offset, position) index, visible size and a cached read-only mmap
+        self.bases = []
+        self.index_offsets = {}
+        self.index_positions = {}
+        self.sizes = {}
+        self.maps = {}
+        self.next_offset = 0
+        self.last_indexed = 0
+        self.closed = False
+        self.lock = Lock()
+        self.appended = Condition(self.lock)
+        self._recover()
+        if not self.bases:
+            self._new_segment()
+        else:
+            base = self.bases[-1]
+            self.file = open(self._path(base, "log"), "ab")
+            self.index_file = open(self._path(base, "index"), "ab")
+
+    def append(self, message):
+        with self.lock:
+            offset = self._write(message)
+            self._flush()
+            return offset
+
+    def append_many(self, messages):
+        with self.lock:
+            first = self.next_offset
+            for message in messages:
+                self._write(message)
+            self._flush()
+            return first
+
+    def get_start_offset(self):
+        return self.bases[0]
+
+    def get_end_offset(self):
+        return self.next_offset
+
+    def read(self, offset, max_messages=1000):
+        # Returns up to max_messages (offset, Message) pairs starting at offset, decoded straight from the mmaps
+        with self.lock:
+            if offset >= self.next_offset:
+                return []
+            first = max(bisect_right(self.bases, offset) - 1, 0)
+            segments = [(base, self.sizes[base], self._map(base)) for base in self.bases[first:]]
+        messages = []
+        frame = self.FRAME
+        for base, size, segment in segments:
+            if size == 0:
+                continue
+            offsets = self.index_offsets[base]
+            position = self.index_positions[base][max(bisect_right(offsets, offset) - 1, 0)]
+            while position < size and len(messages) < max_messages:
+                message_offset, length, encoding = frame.unpack_from(segment, position)
+                start = position + frame.size
+                position = start + length
+                if message_offset < offset:
+                    continue
+                payload = segment[start:position]
+                messages.append((message_offset, Message(payload if encoding == self.RAW else pickle.loads(payload))))
+            if len(messages) >= max_messages:
+                break
+        return messages
+
+    def wait_for(self, offset, timeout=None):
+        # Blocks until a message at offset exists, the log closes or the timeout passes
+        with self.appended:
+            if self.next_offset <= offset and not self.closed:
+                self.appended.wait(timeout)
+            return self.next_offset > offset
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.file.close()
+            self.index_file.close()
+            for segment in self.maps.values():
+                segment.close()
+            self.maps.clear()
+            self.appended.notify_all()
+
+    def _write(self, message):
+        content = message.get_content()
+        if isinstance(content, bytes):
+            payload, encoding = content, self.RAW
+        else:
+            payload, encoding = pickle.dumps(content, pickle.HIGHEST_PROTOCOL), self.PICKLED
+        base = self.bases[-1]
+        if self.sizes[base] >= self.segment_bytes:
+            self._flush()
+            self.file.close()
+            self.index_file.close()
+            self._new_segment()
+            base = self.bases[-1]
+        position = self.sizes[base]
+        offset = self.next_offset
+        if position - self.last_indexed >= self.index_interval:
+            self._add_index_entry(base, offset, position)
+        self.file.write(self.FRAME.pack(offset, len(payload), encoding))
+        self.file.write(payload)
+        self.sizes[base] = position + self.FRAME.size + len(payload)
+        self.next_offset = offset + 1
+        return offset
+
+    def _flush(self):
+        # Readers map the segment files, so the bytes must reach the OS before waking them
+        self.file.flush()
+        self.index_file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.appended.notify_all()
+
+    def _new_segment(self):
+        base = self.next_offset
+        self.bases.append(base)
+        self.sizes[base] = 0
+        self.index_offsets[base] = array("Q")
+        self.index_positions[base] = array("Q")
+        self.file = open(self._path(base, "log"), "ab")
+        self.index_file = open(self._path(base, "index"), "ab")
+        self._add_index_entry(base, base, 0)
+
+    def _add_index_entry(self, base, offset, position):
+        self.index_offsets[base].append(offset)
+        self.index_positions[base].append(position)
+        self.index_file.write(self.INDEX_ENTRY.pack(offset, position))
+        self.last_indexed = position
+
+    def _map(self, base):
+        # Sealed segments are mapped once; the active one is remapped whenever it has grown past its mapping
+        segment = self.maps.get(base)
+        if segment is None or len(segment) < self.sizes[base]:
+            if self.sizes[base] == 0:
+                return None
+            with open(self._path(base, "log"), "rb") as file:
+                segment = mmap.mmap(file.fileno(), self.sizes[base], access=mmap.ACCESS_READ)
+            self.maps[base] = segment
+        return segment
+
+    def _path(self, base, extension):
+        return os.path.join(self.directory, f"{base:020d}.{extension}")
+
+    def _recover(self):
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(".log"))
+        for name in names:
+            base = int(name[:-4])
+            self.bases.append(base)
+            self.sizes[base] = os.path.getsize(self._path(base, "log"))
+            entries = array("Q")
+            index_path = self._path(base, "index")
+            if os.path.exists(index_path):
+                with open(index_path, "rb") as file:
+                    data = file.read()
+                entries.frombytes(data[:len(data) - len(data) % self.INDEX_ENTRY.size])
+            self.index_offsets[base] = entries[0::2]
+            self.index_positions[base] = entries[1::2]
+        if not self.bases:
+            return
+        # Scan the tail of the active segment from its last good index entry, dropping a torn final frame
+        base = self.bases[-1]
+        size = self.sizes[base]
+        offsets = self.index_offsets[base]
+        positions = self.index_positions[base]
+        while positions and positions[-1] >= size:
+            offsets.pop()
+            positions.pop()
+        if not positions:
+            offsets.append(base)
+            positions.append(0)
+        position = positions[-1]
+        next_offset = offsets[-1]
+        with open(self._path(base, "log"), "rb") as file:
+            file.seek(position)
+            data = file.read()
+        cursor = 0
+        while cursor + self.FRAME.size <= len(data):
+            message_offset, length, _ = self.FRAME.unpack_from(data, cursor)
+            if cursor + self.FRAME.size + length > len(data):
+                break
+            cursor += self.FRAME.size + length
+            next_offset = message_offset + 1
+        if position + cursor < size:
+            with open(self._path(base, "log"), "r+b") as file:
+                file.truncate(position + cursor)
+            self.sizes[base] = position + cursor
+        with open(self._path(base, "index"), "wb") as file:
+            for entry in zip(offsets, positions):
+                file.write(self.INDEX_ENTRY.pack(*entry))
+        self.next_offset = next_offset
+        self.last_indexed = positions[-1]
+
+
+# OffsetStore class keeping each durable consumer's next offset in a small JSON file
+class OffsetStore:
+    def __init__(self, path):
+        self.path = path
+        self.offsets = {}
+        self.lock = Lock()
+        if os.path.exists(path):
+            with open(path) as file:
+                self.offsets = json.load(file)
+
+    def get(self, consumer_id, default=None):
+        return self.offsets.get(consumer_id, default)
+
+    def commit(self, consumer_id, offset):
+        # Written to a temporary file and renamed so a crash leaves either the old or the new offsets
+        with self.lock:
+            self.offsets[consumer_id] = offset
+            descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(self.path))
+            with os.fdopen(descriptor, "w") as file:
+                json.dump(self.offsets, file)
+            os.replace(temporary, self.path)
+
+
+# LogConsumer class, a subscriber that pulls a topic from its log, resuming at its committed offset
+class LogConsumer:
+    def __init__(self, topic_log, subscriber, start_offset, consumer_id=None, offset_store=None, batch_size=1000):
+        self.topic_log = topic_log
+        self.subscriber = subscriber
+        self.offset = start_offset
+        self.consumer_id = consumer_id
+        self.offset_store = offset_store
+        self.batch_size = batch_size
+        self.stopped = False
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def get_offset(self):
+        return self.offset
+
+    def stop(self):
+        self.stopped = True
+        self.thread.join()
+
+    def _run(self):
+        while not self.stopped:
+            batch = self.topic_log.read(self.offset, self.batch_size)
+            if not batch:
+                if self.topic_log.closed:
+                    return
+                self.topic_log.wait_for(self.offset, 0.1)
+                continue
+            try:
+                self.subscriber.on_batch([message for _, message in batch])
+            except Exception as e:
+                print(f"Subscriber failed to handle message: {e}")
+            self.offset = batch[-1][0] + 1
+            if self.offset_store is not None:
+                self.offset_store.commit(self.consumer_id, self.offset)
 
 
 # Publisher class
@@ -55,30 +693,539 @@ class Publisher:
 
 # PubSubSystem class
 class PubSubSystem:
-    def __init__(self):
+    def __init__(self, queue_capacity=10000, overflow_policy=OverflowPolicy.DROP_OLDEST, batch_size=1000,
+                 batch_delay=0.0, log_directory=None, segment_bytes=64 * 2 ** 20, fsync=False):
         self.topics = {}
-        self.executor_service = ThreadPoolExecutor(max_workers=10)
+        # With a log directory every topic is persisted and durable consumers can replay or resume
+        self.log_directory = log_directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.offset_store = OffsetStore(os.path.join(log_directory, "offsets.json")) if log_directory else None
+        self.log_consumers = []
+        self.queue_capacity = queue_capacity
+        self.overflow_policy = overflow_policy
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        # One queue and dispatcher per subscriber, shared by all the topics and patterns it subscribes to
+        self.subscriber_queues = {}
+        self.subscription_counts = {}
+        # Every subscription, exact or wildcard, lives in the trie; topics cache their resolved subscribers
+        self.trie = TopicTrie()
+        self.routed_topics = set()
+        self.lock = Lock()
 
     def create_topic(self, topic_name):
-        self.topics.setdefault(topic_name, Topic(topic_name))
+        with self.lock:
+            if topic_name not in self.topics:
+                topic = Topic(topic_name)
+                topic.resolver = self._resolve
+                topic.invalidate()
+                if self.log_directory is not None:
+                    topic.log = TopicLog(self._log_path(topic_name), self.segment_bytes, fsync=self.fsync)
+                self.topics[topic_name] = topic
+
+    def subscribe(self, topic_name, subscriber, queue_capacity=None, overflow_policy=None, batch_size=None,
+                  batch_delay=None):
+        # Wildcard patterns may be subscribed before any matching topic exists
+        if topic_name in self.topics or TopicTrie.is_pattern(topic_name):
+            # Rejected before a new subscriber's queue and dispatcher thread exist
+            TopicTrie.validate(topic_name)
+            with self.lock:
+                queue = self.subscriber_queues.get(subscriber)
+                if queue is None:
+                    queue = SubscriberQueue(subscriber,
+                                            queue_capacity if queue_capacity is not None else self.queue_capacity,
+                                            overflow_policy if overflow_policy is not None else self.overflow_policy,
+                                            batch_size if batch_size is not None else self.batch_size,
+                                            batch_delay if batch_delay is not None else self.batch_delay)
+                    self.subscriber_queues[subscriber] = queue
+                    self.subscription_counts[subscriber] = 0
+                if self.trie.add(topic_name, subscriber, queue):
+                    self.subscription_counts[subscriber] += 1
+                self._invalidate(topic_name)
+
+    def unsubscribe(self, topic_name, subscriber):
+        with self.lock:
+            if not self.trie.remove(topic_name, subscriber):
+                return
+            self._invalidate(topic_name)
+            self.subscription_counts[subscriber] -= 1
+            if self.subscription_counts[subscriber] == 0:
+                del self.subscription_counts[subscriber]
+                self.subscriber_queues.pop(subscriber).close()
+
+    def get_subscriber_queue(self, subscriber):
+        return self.subscriber_queues.get(subscriber)
 
-    def subscribe(self, topic_name, subscriber):
+    def subscribe_group(self, topic_name, group_name, subscriber, num_partitions=8):
+        # The first member fixes the group's partition count
         topic = self.topics.get(topic_name)
         if topic:
-            topic.add_subscriber(subscriber)
+            group = topic.groups.get(group_name)
+            if group is None:
+                group = topic.add_group(ConsumerGroup(group_name, num_partitions, self.queue_capacity,
+                                                      self.overflow_policy, self.batch_size))
+            group.join(subscriber)
+            return group
+        return None
 
-    def unsubscribe(self, topic_name, subscriber):
+    def unsubscribe_group(self, topic_name, group_name, subscriber):
+        # The group and its undelivered messages are kept while it has no members, up to its queue capacity
         topic = self.topics.get(topic_name)
         if topic:
-            topic.remove_subscriber(subscriber)
+            group = topic.groups.get(group_name)
+            if group is not None:
+                group.leave(subscriber)
+
+    def subscribe_durable(self, topic_name, consumer_id, subscriber, from_beginning=False):
+        # Resumes at the consumer's committed offset; a new consumer starts at the beginning or at the tail
+        topic = self.topics.get(topic_name)
+        if topic is None or topic.log is None:
+            return None
+        key = f"{topic_name}/{consumer_id}"
+        start = topic.log.get_start_offset() if from_beginning else topic.log.get_end_offset()
+        consumer = LogConsumer(topic.log, subscriber, self.offset_store.get(key, start), key, self.offset_store,
+                               self.batch_size)
+        with self.lock:
+            self.log_consumers.append(consumer)
+        return consumer
+
+    def replay(self, topic_name, subscriber, from_offset=0, batch_size=None):
+        # Synchronously delivers everything logged from from_offset and returns the next offset
+        topic = self.topics.get(topic_name)
+        if topic is None or topic.log is None:
+            return from_offset
+        offset = from_offset
+        while True:
+            batch = topic.log.read(offset, batch_size or self.batch_size)
+            if not batch:
+                return offset
+            subscriber.on_batch([message for _, message in batch])
+            offset = batch[-1][0] + 1
+
+    def _log_path(self, topic_name):
+        # Percent-encoded with a prefix, so no topic name can leave log_directory or collide with offsets.json
+        return os.path.join(self.log_directory, "topic-" + quote(topic_name, safe=""))
+
+    def _resolve(self, topic):
+        # Called by a topic whose cache was invalidated; caching under the system lock means a concurrent
+        # subscription change either lands before the match or invalidates the result afterwards
+        with self.lock:
+            subscribers = dict(topic.direct_subscribers)
+            subscribers.update(self.trie.match(topic.name))
+            topic.subscribers = subscribers
+            self.routed_topics.add(topic.name)
+            return subscribers
+
+    def _invalidate(self, pattern):
+        if not TopicTrie.is_pattern(pattern):
+            if pattern in self.routed_topics:
+                self.routed_topics.discard(pattern)
+                self.topics[pattern].invalidate()
+            return
+        for topic_name in [name for name in self.routed_topics if TopicTrie.matches(pattern, name)]:
+            self.routed_topics.discard(topic_name)
+            self.topics[topic_name].invalidate()
 
     def publish(self, topic_name, message):
         topic = self.topics.get(topic_name)
         if topic:
-            self.executor_service.submit(topic.publish, message)
+            topic.publish(message)
+
+    def publish_many(self, topic_name, messages):
+        topic = self.topics.get(topic_name)
+        if topic:
+            topic.publish_many(messages)
 
     def shutdown(self):
-        self.executor_service.shutdown()
+        with self.lock:
+            queues = list(self.subscriber_queues.values())
+            self.subscriber_queues.clear()
+            self.subscription_counts.clear()
+        for queue in queues:
+            queue.close()
+        for queue in queues:
+            queue.join()
+        for consumer in self.log_consumers:
+            consumer.stop()
+        self.log_consumers.clear()
+        for topic in self.topics.values():
+            for group in list(topic.groups.values()):
+                group.close()
+            if topic.log is not None:
+                topic.log.close()
+
+
+# AsyncSubscription class, an async iterator over the messages routed to one subscription
+class AsyncSubscription:
+    _CLOSED = object()
+
+    def __init__(self, pattern, queue_size, overflow_policy):
+        self.pattern = pattern
+        self.queue = asyncio.Queue(queue_size)
+        self.overflow_policy = overflow_policy
+        self.closed = False
+        self.dropped = 0
+        # Set whenever the consumer takes a message or the subscription closes, so blocked publishers re-check
+        self.room = asyncio.Event()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and self.queue.empty():
+            raise StopAsyncIteration
+        message = await self.queue.get()
+        self.room.set()
+        if message is self._CLOSED:
+            raise StopAsyncIteration
+        return message
+
+    async def put(self, message):
+        if self.closed:
+            return False
+        if not self.queue.full():
+            self.queue.put_nowait(message)
+            return True
+        if self.overflow_policy == OverflowPolicy.DROP_NEWEST:
+            self.dropped += 1
+            return False
+        if self.overflow_policy == OverflowPolicy.DROP_OLDEST:
+            self.queue.get_nowait()
+            self.queue.put_nowait(message)
+            self.dropped += 1
+            return True
+        # Not queue.put: a publisher blocked there would never be woken once the consumer is gone
+        while self.queue.full():
+            self.room.clear()
+            await self.room.wait()
+            if self.closed:
+                return False
+        self.queue.put_nowait(message)
+        return True
+
+    def get_dropped_count(self):
+        return self.dropped
+
+    def close(self):
+        # A consumer waiting on an empty queue is woken by the marker; a full queue is drained first. Publishers
+        # blocked on a full queue are released and their messages dropped
+        if not self.closed:
+            self.closed = True
+            self.room.set()
+            if not self.queue.full():
+                self.queue.put_nowait(self._CLOSED)
+
+
+# AsyncPubSubSystem class, the asyncio counterpart of PubSubSystem with one bounded queue per subscription
+class AsyncPubSubSystem:
+    def __init__(self, queue_size=1000, overflow_policy=OverflowPolicy.DROP_OLDEST):
+        self.topics = set()
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.trie = TopicTrie()
+        # Concrete topic -> matching subscriptions, dropped whenever the subscriptions change
+        self.routes = {}
+
+    def create_topic(self, topic_name):
+        self.topics.add(topic_name)
+
+    def subscribe(self, topic_name, queue_size=None, overflow_policy=None):
+        if topic_name not in self.topics and not TopicTrie.is_pattern(topic_name):
+            return None
+        subscription = AsyncSubscription(topic_name, queue_size if queue_size is not None else self.queue_size,
+                                         overflow_policy if overflow_policy is not None else self.overflow_policy)
+        self.trie.add(topic_name, subscription, None)
+        self.routes.clear()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if self.trie.remove(subscription.pattern, subscription):
+            self.routes.clear()
+        subscription.close()
+
+    async def publish(self, topic_name, message):
+        # Subscriptions are filled in order, so each one sees a topic's messages in publish order
+        for subscription in self._route(topic_name):
+            await subscription.put(message)
+
+    async def publish_many(self, topic_name, messages):
+        subscriptions = self._route(topic_name)
+        for message in messages:
+            for subscription in subscriptions:
+                await subscription.put(message)
+
+    async def shutdown(self):
+        # Every subscription, exact or pattern, hangs off the trie
+        self._close_subscriptions(self.trie.root)
+
+    def _route(self, topic_name):
+        subscriptions = self.routes.get(topic_name)
+        if subscriptions is None:
+            if topic_name not in self.topics:
+                return ()
+            subscriptions = tuple(self.trie.match(topic_name))
+            self.routes[topic_name] = subscriptions
+        return subscriptions
+
+    def _close_subscriptions(self, node):
+        for subscription in node.subscribers:
+            subscription.close()
+        for child in node.children.values():
+            self._close_subscriptions(child)
+
+
+# SharedMemoryRing class, a single-writer broadcast ring of length-prefixed payloads in shared memory
+class SharedMemoryRing:
+    # Header: write position, capacity, reader slots, creator pid; then per reader slot its cursor, heartbeat and
+    # pid; then the data region. Positions only ever grow; a byte lives at position % capacity in the data region.
+    HEADER = struct.Struct("<QQQQ")
+    SLOT = struct.Struct("<QQQ")
+    CURSOR = struct.Struct("<Q")
+    READER_STATE = struct.Struct("<QQ")
+    LENGTH = struct.Struct("<I")
+    PADDING = 0xFFFFFFFF
+    INACTIVE = 0xFFFFFFFFFFFFFFFF
+
+    def __init__(self, name=None, capacity=64 * 2 ** 20, num_slots=16):
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=self._data_offset(num_slots) + capacity)
+            self.capacity = capacity
+            self.num_slots = num_slots
+            self.HEADER.pack_into(self.memory.buf, 0, 0, capacity, num_slots, os.getpid())
+            for slot in range(num_slots):
+                self.SLOT.pack_into(self.memory.buf, self._slot_offset(slot), self.INACTIVE, 0, 0)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+            _, self.capacity, self.num_slots, creator_pid = self.HEADER.unpack_from(self.memory.buf, 0)
+            # Attaching registers the segment with this process's resource tracker, which unlinks it when the process
+            # exits. Only the creator owns it; the creator itself and its multiprocessing children share its tracker
+            # and must leave it be
+            parent = multiprocessing.parent_process()
+            if os.getpid() != creator_pid and (parent is None or parent.pid != creator_pid):
+                resource_tracker.unregister(self.memory._name, "shared_memory")
+        self.name = self.memory.name
+        self.data = self.memory.buf[self._data_offset(self.num_slots):self._data_offset(self.num_slots) + self.capacity]
+
+    def get_write_position(self):
+        return self.HEADER.unpack_from(self.memory.buf, 0)[0]
+
+    def set_write_position(self, position):
+        self.CURSOR.pack_into(self.memory.buf, 0, position)
+
+    def get_cursor(self, slot):
+        return self.CURSOR.unpack_from(self.memory.buf, self._slot_offset(slot))[0]
+
+    def set_cursor(self, slot, position):
+        # Every cursor update doubles as the reader's heartbeat; CLOCK_MONOTONIC is shared by all processes
+        self.READER_STATE.pack_into(self.memory.buf, self._slot_offset(slot), position, time.monotonic_ns())
+
+    def get_reader_pid(self, slot):
+        return self.SLOT.unpack_from(self.memory.buf, self._slot_offset(slot))[2]
+
+    def get_min_cursor(self):
+        return min(self.get_cursor(slot) for slot in range(self.num_slots))
+
+    def claim_slot(self, slot=None):
+        # Shared memory has no compare-and-swap, so a claim is an exclusively created file: only one process wins it
+        if slot is not None and not 0 <= slot < self.num_slots:
+            raise ValueError(f"Reader slot {slot} does not exist.")
+        for candidate in range(self.num_slots) if slot is None else [slot]:
+            try:
+                os.close(os.open(self._claim_path(candidate), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                continue
+            self.SLOT.pack_into(self.memory.buf, self._slot_offset(candidate), self.INACTIVE, time.monotonic_ns(),
+                                os.getpid())
+            return candidate
+        raise ValueError("No free reader slot." if slot is None else f"Reader slot {slot} is already in use.")
+
+    def release_slot(self, slot):
+        self.SLOT.pack_into(self.memory.buf, self._slot_offset(slot), self.INACTIVE, 0, 0)
+        try:
+            os.remove(self._claim_path(slot))
+        except FileNotFoundError:
+            pass
+
+    def release_dead_slots(self, timeout=None):
+        # A reader that died, or has not moved its cursor for timeout seconds, would hold the writer back forever
+        now = time.monotonic_ns()
+        released = 0
+        for slot in range(self.num_slots):
+            cursor, heartbeat, pid = self.SLOT.unpack_from(self.memory.buf, self._slot_offset(slot))
+            if cursor == self.INACTIVE:
+                continue
+            if self._is_alive(pid) and (timeout is None or now - heartbeat <= timeout * 1e9):
+                continue
+            self.release_slot(slot)
+            released += 1
+        return released
+
+    def close(self):
+        self.data.release()
+        self.memory.close()
+
+    def unlink(self):
+        for slot in range(self.num_slots):
+            try:
+                os.remove(self._claim_path(slot))
+            except FileNotFoundError:
+                pass
+        self.memory.unlink()
+
+    @staticmethod
+    def _is_alive(pid):
+        if not pid:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _claim_path(self, slot):
+        return os.path.join(tempfile.gettempdir(), f"{self.name.lstrip('/')}.slot{slot}")
+
+    @staticmethod
+    def _slot_offset(slot):
+        return SharedMemoryRing.HEADER.size + slot * SharedMemoryRing.SLOT.size
+
+    @staticmethod
+    def _data_offset(num_slots):
+        # Keep the data region cache-line aligned
+        return (SharedMemoryRing.HEADER.size + num_slots * SharedMemoryRing.SLOT.size + 63) // 64 * 64
+
+
+# SharedMemoryPublisher class, the only writer of a SharedMemoryRing
+class SharedMemoryPublisher:
+    # A blocked writer backs off from spinning to sleeps of at most this many seconds
+    MAX_BACKOFF = 0.001
+
+    def __init__(self, ring, block_on_slow_readers=True, reader_timeout=10.0):
+        self.ring = ring
+        # When blocking, the writer never laps a registered reader; otherwise slow readers lose messages
+        self.block_on_slow_readers = block_on_slow_readers
+        # A blocked writer evicts readers that died or have not read for reader_timeout seconds (None: only dead ones)
+        self.reader_timeout = reader_timeout
+        self.position = ring.get_write_position()
+        # Readers that attach later start at a published position, so this stays a safe lower bound
+        self.min_cursor = min(ring.get_min_cursor(), self.position)
+
+    def publish(self, message):
+        self._write(message.get_content())
+        self.ring.set_write_position(self.position)
+
+    def publish_batch(self, messages):
+        # Readers see the whole batch at once: the write position is published a single time
+        for message in messages:
+            self._write(message.get_content())
+        self.ring.set_write_position(self.position)
+
+    def _write(self, payload):
+        ring = self.ring
+        capacity = ring.capacity
+        size = ring.LENGTH.size + len(payload)
+        if size > capacity:
+            raise ValueError("Message does not fit in the ring buffer.")
+        offset = self.position % capacity
+        padding = capacity - offset if offset + size > capacity else 0
+        if self.block_on_slow_readers:
+            self._wait_for_room(padding + size)
+        if padding:
+            # Frames never wrap; a padding marker (or a tail too short for one) sends readers back to the start
+            if padding >= ring.LENGTH.size:
+                ring.LENGTH.pack_into(ring.data, offset, ring.PADDING)
+            self.position += padding
+            offset = 0
+        ring.LENGTH.pack_into(ring.data, offset, len(payload))
+        ring.data[offset + ring.LENGTH.size:offset + size] = payload
+        self.position += size
+
+    def _wait_for_room(self, size):
+        if self.position + size - self.min_cursor <= self.ring.capacity:
+            return
+        # Publish what is written so far, otherwise readers could never catch up
+        self.ring.set_write_position(self.position)
+        delay = 0.0
+        while True:
+            self.min_cursor = min(self.ring.get_min_cursor(), self.position)
+            if self.position + size - self.min_cursor <= self.ring.capacity:
+                return
+            if delay >= self.MAX_BACKOFF:
+                # Only checked once sleeping at full back-off, a live reader has had every chance to catch up
+                self.ring.release_dead_slots(self.reader_timeout)
+            time.sleep(delay)
+            delay = min(delay * 2 or 0.00001, self.MAX_BACKOFF)
+
+
+# SharedMemorySubscriber class reading a SharedMemoryRing from its own cursor without copying payloads
+class SharedMemorySubscriber:
+    def __init__(self, name, slot=None, from_beginning=False):
+        self.ring = SharedMemoryRing(name)
+        try:
+            self.slot = self.ring.claim_slot(slot)
+        except ValueError:
+            self.ring.close()
+            raise
+        self.pid = os.getpid()
+        self.cursor = 0 if from_beginning else self.ring.get_write_position()
+        self.lost = 0
+        self.ring.set_cursor(self.slot, self.cursor)
+
+    def read_batch(self, max_messages=1024):
+        # Returned memoryviews point into shared memory and stay valid until the next read: only then is the
+        # cursor published and the writer allowed to reuse that space
+        ring = self.ring
+        capacity = ring.capacity
+        data = ring.data
+        if ring.get_reader_pid(self.slot) != self.pid:
+            # The writer evicted this reader as stalled; it rejoins at the write position like a lapped reader
+            self.slot = ring.claim_slot()
+            self.lost += 1
+            self.cursor = ring.get_write_position()
+        ring.set_cursor(self.slot, self.cursor)
+        write_position = ring.get_write_position()
+        if write_position - self.cursor > capacity:
+            # Lapped by a non-blocking writer: frame boundaries in the overwritten data are unknown, so resume
+            # at the write position and drop everything still in the ring
+            self.lost += 1
+            self.cursor = write_position
+            return []
+        position = self.cursor
+        views = []
+        length_size = ring.LENGTH.size
+        while position < write_position and len(views) < max_messages:
+            offset = position % capacity
+            if capacity - offset < length_size:
+                position += capacity - offset
+                continue
+            length = ring.LENGTH.unpack_from(data, offset)[0]
+            if length == ring.PADDING:
+                position += capacity - offset
+                continue
+            views.append(data[offset + length_size:offset + length_size + length])
+            position += length_size + length
+        if ring.get_write_position() - self.cursor > capacity:
+            # The writer wrapped over this batch while it was being read
+            self.lost += 1
+            self.cursor = ring.get_write_position()
+            return []
+        self.cursor = position
+        return views
+
+    def read(self):
+        views = self.read_batch(1)
+        return views[0] if views else None
+
+    def get_lost_count(self):
+        return self.lost
+
+    def close(self):
+        if self.ring.get_reader_pid(self.slot) == self.pid:
+            self.ring.release_slot(self.slot)
+        self.ring.close()
 
 
 # PubSubSystemDemo class
@@ -118,6 +1265,154 @@ class PubSubSystemDemo:
         pub_sub_system.shutdown()
 
 
+# CountingSubscriber class used by the benchmark, counting messages one at a time or in batches
+class CountingSubscriber(Subscriber):
+    def __init__(self, batched):
+        self.count = 0
+        self.batched = batched
+
+    def on_message(self, message):
+        self.count += 1
+
+    def on_batch(self, messages):
+        if self.batched:
+            self.count += len(messages)
+        else:
+            super().on_batch(messages)
+
+
+# PubSubBatchBenchmark class comparing per-message publish with publish_many and batch delivery
+class PubSubBatchBenchmark:
+    @staticmethod
+    def run(num_messages=1000000, publish_batch=1000, batch_delay=0.001):
+        for batched in (False, True):
+            pub_sub_system = PubSubSystem(queue_capacity=100000, overflow_policy=OverflowPolicy.BLOCK,
+                                          batch_delay=batch_delay if batched else 0.0)
+            pub_sub_system.create_topic("telemetry")
+            subscriber = CountingSubscriber(batched)
+            pub_sub_system.subscribe("telemetry", subscriber)
+            messages = [Message(i) for i in range(num_messages)]
+            start = time.perf_counter()
+            if batched:
+                for offset in range(0, num_messages, publish_batch):
+                    pub_sub_system.publish_many("telemetry", messages[offset:offset + publish_batch])
+            else:
+                for message in messages:
+                    pub_sub_system.publish("telemetry", message)
+            pub_sub_system.shutdown()
+            elapsed = time.perf_counter() - start
+            label = "publish_many + on_batch" if batched else "publish + on_message  "
+            print(f"{label}: {subscriber.count / elapsed:>10.0f} msgs/sec delivered")
+
+
+# TopicLogBenchmark class measuring log appends and a restarted consumer catching up from disk
+class TopicLogBenchmark:
+    @staticmethod
+    def run(num_messages=1000000, payload_size=100, publish_batch=1000):
+        payload = b"x" * payload_size
+        with tempfile.TemporaryDirectory() as directory:
+            pub_sub_system = PubSubSystem(log_directory=directory, segment_bytes=16 * 2 ** 20)
+            pub_sub_system.create_topic("ticks")
+            messages = [Message(payload) for _ in range(publish_batch)]
+            start = time.perf_counter()
+            for _ in range(num_messages // publish_batch):
+                pub_sub_system.publish_many("ticks", messages)
+            elapsed = time.perf_counter() - start
+            pub_sub_system.shutdown()
+            print(f"append:   {num_messages / elapsed:>10.0f} msgs/sec")
+
+            # A fresh system over the same directory recovers the log and replays it from offset 0
+            pub_sub_system = PubSubSystem(log_directory=directory, segment_bytes=16 * 2 ** 20)
+            pub_sub_system.create_topic("ticks")
+            subscriber = CountingSubscriber(True)
+            start = time.perf_counter()
+            pub_sub_system.replay("ticks", subscriber)
+            elapsed = time.perf_counter() - start
+            pub_sub_system.shutdown()
+            print(f"catch-up: {subscriber.count / elapsed:>10.0f} msgs/sec ({subscriber.count} messages)")
+
+
+# AsyncPubSubBenchmark class measuring delivery rate and latency through AsyncPubSubSystem
+class AsyncPubSubBenchmark:
+    @staticmethod
+    def run(num_subscribers=100, num_messages=20000, queue_size=1000):
+        print(asyncio.run(AsyncPubSubBenchmark._load(num_subscribers, num_messages, queue_size)))
+
+    @staticmethod
+    async def _load(num_subscribers, num_messages, queue_size):
+        # Backpressure, not drops: every message reaches every subscriber
+        pub_sub_system = AsyncPubSubSystem(queue_size, OverflowPolicy.BLOCK)
+        pub_sub_system.create_topic("ticks")
+        subscriptions = [pub_sub_system.subscribe("ticks") for _ in range(num_subscribers)]
+        latencies = []
+
+        async def consume(subscription):
+            async for message in subscription:
+                latencies.append(time.perf_counter() - message.get_content())
+
+        consumers = [asyncio.create_task(consume(subscription)) for subscription in subscriptions]
+        start = time.perf_counter()
+        for _ in range(num_messages):
+            await pub_sub_system.publish("ticks", Message(time.perf_counter()))
+        await pub_sub_system.shutdown()
+        await asyncio.gather(*consumers)
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        return (f"{len(latencies) / elapsed:.0f} deliveries/sec to {num_subscribers} subscribers, "
+                f"p50 latency {latencies[len(latencies) // 2] * 1e3:.2f} ms, "
+                f"p99 {latencies[int(len(latencies) * 0.99)] * 1e3:.2f} ms")
+
+
+# SharedMemoryRingBenchmark class fanning out small payloads to reader processes through shared memory
+class SharedMemoryRingBenchmark:
+    @staticmethod
+    def run(num_readers=4, num_messages=1000000, payload_size=64, batch_size=256, capacity=16 * 2 ** 20):
+        context = multiprocessing.get_context("spawn")
+        ring = SharedMemoryRing(capacity=capacity, num_slots=num_readers)
+        ready = context.Barrier(num_readers + 1)
+        results = context.Queue()
+        num_messages -= num_messages % batch_size
+        readers = [context.Process(target=SharedMemoryRingBenchmark._read,
+                                   args=(ring.name, slot, num_messages, ready, results))
+                   for slot in range(num_readers)]
+        for reader in readers:
+            reader.start()
+        ready.wait()
+        publisher = SharedMemoryPublisher(ring)
+        batch = [Message(bytes(payload_size)) for _ in range(batch_size)]
+        start = time.perf_counter()
+        for _ in range(num_messages // batch_size):
+            publisher.publish_batch(batch)
+        received = [results.get() for _ in readers]
+        elapsed = time.perf_counter() - start
+        for reader in readers:
+            reader.join()
+        ring.close()
+        ring.unlink()
+        total = sum(count for count, _ in received)
+        print(f"{num_messages} messages to {num_readers} readers: "
+              f"{total / elapsed:.0f} deliveries/sec, {sum(lost for _, lost in received)} laps, "
+              f"{multiprocessing.cpu_count()} CPUs")
+
+    @staticmethod
+    def _read(name, slot, num_messages, ready, results):
+        subscriber = SharedMemorySubscriber(name, slot)
+        ready.wait()
+        count = 0
+        total_bytes = 0
+        while count < num_messages:
+            views = subscriber.read_batch()
+            if not views:
+                time.sleep(0)
+                continue
+            count += len(views)
+            total_bytes += sum(len(view) for view in views)
+            # The views must be released before the shared memory can be closed
+            views = None
+        results.put((count, subscriber.get_lost_count()))
+        subscriber.close()
+
+
 # Run the demo
 if __name__ == "__main__":
-    PubSubSystemDemo.run()
\ No newline at end of file
+    PubSubSystemDemo.run()
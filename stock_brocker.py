@@ -1,6 +1,32 @@
+import asyncio
+import bisect
+import gc
+import heapq
+import itertools
+import json
+import mmap
+import os
+import pickle
+import random
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
 from enum import Enum
-from queue import Queue
-from threading import Lock
+from operator import itemgetter
+from queue import Empty, Queue, SimpleQueue
+from threading import Condition, Event, Lock, RLock, Thread
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 # Exception classes
@@ -10,12 +36,23 @@ class InsufficientFundsException(Exception):
 class InsufficientStockException(Exception):
     pass
 
+class RiskLimitExceededException(Exception):
+    pass
+
 
 # Enum for Order Status
 class OrderStatus(Enum):
     PENDING = 0
     EXECUTED = 1
     REJECTED = 2
+    PARTIALLY_FILLED = 3
+    CANCELLED = 4
+
+
+# Enum for Order Side
+class OrderSide(Enum):
+    BUY = 0
+    SELL = 1
 
 
 # Portfolio class to manage the stock holdings of an account
@@ -23,23 +60,35 @@ class Portfolio:
     def __init__(self, account):
         self.account = account
         self.holdings = {}
+        self.observers = []
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def notify_observers(self, symbol):
+        for observer in self.observers:
+            observer.on_holding_change(self.account, symbol, self.holdings.get(symbol, 0))
 
     def add_stock(self, stock, quantity):
         symbol = stock.get_symbol()
-        self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
+        with self.account.lock:
+            self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
+            self.notify_observers(symbol)
 
     def remove_stock(self, stock, quantity):
         symbol = stock.get_symbol()
-        if symbol in self.holdings:
-            current_quantity = self.holdings[symbol]
-            if current_quantity > quantity:
-                self.holdings[symbol] = current_quantity - quantity
-            elif current_quantity == quantity:
-                del self.holdings[symbol]
+        with self.account.lock:
+            if symbol in self.holdings:
+                current_quantity = self.holdings[symbol]
+                if current_quantity > quantity:
+                    self.holdings[symbol] = current_quantity - quantity
+                elif current_quantity == quantity:
+                    del self.holdings[symbol]
+                else:
+                    raise InsufficientStockException("Insufficient stock quantity in the portfolio.")
             else:
-                raise InsufficientStockException("Insufficient stock quantity in the portfolio.")
-        else:
-            raise InsufficientStockException("Stock not found in the portfolio.")
+                raise InsufficientStockException("Stock not found in the portfolio.")
+            self.notify_observers(symbol)
 
     def get_holdings(self):
         return self.holdings
@@ -51,9 +100,16 @@ class Stock:
         self.symbol = symbol
         self.name = name
         self.price = price
+        self.observers = []
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
 
     def update_price(self, new_price):
+        old_price = self.price
         self.price = new_price
+        for observer in self.observers:
+            observer.on_price_update(self, old_price, new_price)
 
     def get_symbol(self):
         return self.symbol
@@ -67,6 +123,8 @@ class Stock:
 
 # Order class, base class for buy and sell orders
 class Order:
+    side = None
+
     def __init__(self, order_id, account, stock, quantity, price):
         self.order_id = order_id
         self.account = account
@@ -74,59 +132,362 @@ class Order:
         self.quantity = quantity
         self.price = price
         self.status = OrderStatus.PENDING
+        self.filled_quantity = 0
+        self.sequence = 0
 
-    def execute(self):
+    def get_remaining_quantity(self):
+        return self.quantity - self.filled_quantity
+
+    def is_active(self):
+        return self.status == OrderStatus.PENDING or self.status == OrderStatus.PARTIALLY_FILLED
+
+    def crosses(self, price):
         pass
 
+    def validate(self, quantity, price):
+        pass
+
+    def execute(self, quantity=None, price=None):
+        pass
+
+    def _record_fill(self, quantity):
+        self.filled_quantity += quantity
+        if self.filled_quantity >= self.quantity:
+            self.status = OrderStatus.EXECUTED
+        else:
+            self.status = OrderStatus.PARTIALLY_FILLED
+
 
 # BuyOrder class for executing buy orders
 class BuyOrder(Order):
+    side = OrderSide.BUY
+
     def __init__(self, order_id, account, stock, quantity, price):
         super().__init__(order_id, account, stock, quantity, price)
 
-    def execute(self):
-        total_cost = self.quantity * self.price
-        if self.account.get_balance() >= total_cost:
-            self.account.withdraw(total_cost)
-            self.account.get_portfolio().add_stock(self.stock, self.quantity)
-            self.status = OrderStatus.EXECUTED
-        else:
+    def crosses(self, price):
+        return price <= self.price
+
+    def validate(self, quantity, price):
+        if self.account.get_balance() < quantity * price:
             self.status = OrderStatus.REJECTED
             raise InsufficientFundsException("Insufficient funds to execute the buy order.")
 
+    def execute(self, quantity=None, price=None):
+        # Defaults to filling the whole remaining quantity at the order's own price
+        quantity = self.get_remaining_quantity() if quantity is None else quantity
+        price = self.price if price is None else price
+        with self.account.lock:
+            self.validate(quantity, price)
+            self.account.withdraw(quantity * price)
+            self.account.get_portfolio().add_stock(self.stock, quantity)
+            self._record_fill(quantity)
+
 
 # SellOrder class for executing sell orders
 class SellOrder(Order):
+    side = OrderSide.SELL
+
     def __init__(self, order_id, account, stock, quantity, price):
         super().__init__(order_id, account, stock, quantity, price)
 
-    def execute(self):
-        total_proceeds = self.quantity * self.price
-        if self.account.get_portfolio().get_holdings().get(self.stock.get_symbol(), 0) >= self.quantity:
-            self.account.get_portfolio().remove_stock(self.stock, self.quantity)
-            self.account.deposit(total_proceeds)
-            self.status = OrderStatus.EXECUTED
-        else:
+    def crosses(self, price):
+        return price >= self.price
+
+    def validate(self, quantity, price):
+        if self.account.get_portfolio().get_holdings().get(self.stock.get_symbol(), 0) < quantity:
             self.status = OrderStatus.REJECTED
             raise InsufficientStockException("Insufficient stock to execute the sell order.")
 
+    def execute(self, quantity=None, price=None):
+        quantity = self.get_remaining_quantity() if quantity is None else quantity
+        price = self.price if price is None else price
+        with self.account.lock:
+            self.validate(quantity, price)
+            self.account.get_portfolio().remove_stock(self.stock, quantity)
+            self.account.deposit(quantity * price)
+            self._record_fill(quantity)
+
+
+# Trade class representing a fill between a buy order and a sell order
+class Trade:
+    def __init__(self, trade_id, symbol, buy_order, sell_order, quantity, price):
+        self.trade_id = trade_id
+        self.symbol = symbol
+        self.buy_order = buy_order
+        self.sell_order = sell_order
+        self.quantity = quantity
+        self.price = price
+        self.timestamp = datetime.now()
+
+
+# OrderBook class holding the resting limit orders of one symbol
+class OrderBook:
+    def __init__(self, symbol):
+        self.symbol = symbol
+        # Heap entries are (key, sequence, order); bids use the negated price so both heaps are min-heaps
+        self.bids = []
+        self.asks = []
+        self.orders = {}
+        # Heap entries of removed orders that are still waiting to be pruned
+        self.stale = 0
+        self.lock = Lock()
+
+    def add(self, order):
+        if order.side == OrderSide.BUY:
+            heapq.heappush(self.bids, (-order.price, order.sequence, order))
+        else:
+            heapq.heappush(self.asks, (order.price, order.sequence, order))
+        self.orders[order.order_id] = order
+
+    def remove(self, order):
+        # Heap entries are deleted lazily; pruning keeps the top of each heap live
+        if self.orders.pop(order.order_id, None) is not None:
+            self.stale += 1
+        self._prune(self.bids)
+        self._prune(self.asks)
+        self._compact()
+
+    def get_order(self, order_id):
+        return self.orders.get(order_id)
+
+    def best_bid(self):
+        return self.bids[0][2] if self.bids else None
+
+    def best_ask(self):
+        return self.asks[0][2] if self.asks else None
+
+    def best_bid_price(self):
+        return self.bids[0][2].price if self.bids else None
+
+    def best_ask_price(self):
+        return self.asks[0][2].price if self.asks else None
+
+    def opposite_side(self, order):
+        return self.asks if order.side == OrderSide.BUY else self.bids
+
+    def _prune(self, heap):
+        while heap:
+            _, sequence, order = heap[0]
+            if self._is_live(sequence, order):
+                break
+            heapq.heappop(heap)
+            self.stale -= 1
+
+    def _compact(self):
+        # Rebuild once stale entries make up half the heaps so requote churn deep in the book does not pile up
+        if self.stale * 2 > len(self.bids) + len(self.asks):
+            # In place, the matching loop holds a reference to the opposite heap
+            self.bids[:] = [entry for entry in self.bids if self._is_live(entry[1], entry[2])]
+            self.asks[:] = [entry for entry in self.asks if self._is_live(entry[1], entry[2])]
+            heapq.heapify(self.bids)
+            heapq.heapify(self.asks)
+            self.stale = 0
+
+    def _is_live(self, sequence, order):
+        return order.sequence == sequence and order.is_active() and self.orders.get(order.order_id) is order
+
+
+# SettlementState class, per-thread flag set while a fill is being applied to its two accounts and its price published
+class SettlementState(threading.local):
+    settling = False
+
+
+# OrderEventObserver base class for listeners of order lifecycle events
+class OrderEventObserver:
+    def on_order_accepted(self, order):
+        pass
+
+    def on_order_replaced(self, order):
+        pass
+
+    def on_trade(self, trade):
+        pass
+
+    def on_order_closed(self, order):
+        pass
+
+
+# MatchingEngine class matching orders by price-time priority across per-symbol order books
+class MatchingEngine:
+    def __init__(self, account_locks=None):
+        self.account_locks = account_locks or AccountLockStriping()
+        self.order_books = {}
+        self.order_index = {}
+        self.sequence = itertools.count(1)
+        self.trade_id_counter = itertools.count(1)
+        self.observers = []
+        self.settlement = SettlementState()
+        self.lock = Lock()
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def get_order_book(self, symbol):
+        book = self.order_books.get(symbol)
+        if book is None:
+            with self.lock:
+                book = self.order_books.setdefault(symbol, OrderBook(symbol))
+        return book
+
+    def submit(self, order):
+        book = self.get_order_book(order.stock.get_symbol())
+        with book.lock:
+            if order.order_id in self.order_index:
+                raise ValueError(f"Duplicate order id {order.order_id}.")
+            order.validate(order.get_remaining_quantity(), order.price)
+            for observer in self.observers:
+                observer.on_order_accepted(order)
+            return self._match(book, order)
+
+    def restore_order(self, order):
+        # Rests a recovered order on its book without matching or notifying observers
+        book = self.get_order_book(order.stock.get_symbol())
+        with book.lock:
+            order.sequence = next(self.sequence)
+            book.add(order)
+            self.order_index[order.order_id] = book
+
+    def cancel_order(self, order_id):
+        book = self.order_index.get(order_id)
+        if book is None:
+            return False
+        with book.lock:
+            order = book.get_order(order_id)
+            if order is None or not order.is_active():
+                return False
+            order.status = OrderStatus.CANCELLED
+            self._remove(book, order)
+            self._notify_closed(order)
+            return True
+
+    def replace_order(self, order_id, quantity=None, price=None):
+        book = self.order_index.get(order_id)
+        if book is None:
+            return None
+        with book.lock:
+            order = book.get_order(order_id)
+            if order is None or not order.is_active():
+                return None
+            quantity = order.quantity if quantity is None else quantity
+            price = order.price if price is None else price
+            if quantity <= order.filled_quantity:
+                raise ValueError("Replacement quantity must exceed the filled quantity.")
+            if price == order.price and quantity <= order.quantity:
+                # Shrinking an order in place keeps its time priority
+                order.quantity = quantity
+                self._notify_replaced(order)
+                return []
+            self._remove(book, order)
+            order.quantity = quantity
+            order.price = price
+            self._notify_replaced(order)
+            try:
+                order.validate(order.get_remaining_quantity(), order.price)
+            except (InsufficientFundsException, InsufficientStockException):
+                self._notify_closed(order)
+                raise
+            return self._match(book, order)
+
+    def _match(self, book, order):
+        trades = []
+        opposite = book.opposite_side(order)
+        order.sequence = next(self.sequence)
+        while order.get_remaining_quantity() > 0 and opposite:
+            resting = opposite[0][2]
+            if not order.crosses(resting.price):
+                break
+            quantity = min(order.get_remaining_quantity(), resting.get_remaining_quantity())
+            price = resting.price
+            # Lock order is always symbol (book lock, already held) then account stripes ascending
+            with self.account_locks.acquire(order.account, resting.account):
+                try:
+                    resting.validate(quantity, price)
+                except (InsufficientFundsException, InsufficientStockException):
+                    # The resting side can no longer settle, drop it and keep matching
+                    self._remove(book, resting)
+                    self._notify_closed(resting)
+                    continue
+                self.settlement.settling = True
+                try:
+                    order.execute(quantity, price)
+                    resting.execute(quantity, price)
+                except (InsufficientFundsException, InsufficientStockException):
+                    self._notify_closed(order)
+                    raise
+                finally:
+                    self.settlement.settling = False
+                # Still under the account locks, so the journal's EXECUTION record is ordered before any later
+                # out-of-band change to either account
+                trade = self._create_trade(book.symbol, order, resting, quantity, price)
+                trades.append(trade)
+                for observer in self.observers:
+                    observer.on_trade(trade)
+            # Still flagged as settlement, observers that took the trade can skip its price update
+            self.settlement.settling = True
+            try:
+                order.stock.update_price(price)
+            finally:
+                self.settlement.settling = False
+            if not resting.is_active():
+                self._remove(book, resting)
+                self._notify_closed(resting)
+        if order.is_active():
+            book.add(order)
+            self.order_index[order.order_id] = book
+        else:
+            self._notify_closed(order)
+        return trades
+
+    def _notify_replaced(self, order):
+        for observer in self.observers:
+            observer.on_order_replaced(order)
+
+    def _notify_closed(self, order):
+        for observer in self.observers:
+            observer.on_order_closed(order)
+
+    def _remove(self, book, order):
+        self.order_index.pop(order.order_id, None)
+        book.remove(order)
+
+    def _create_trade(self, symbol, order, resting, quantity, price):
+        if order.side == OrderSide.BUY:
+            buy_order, sell_order = order, resting
+        else:
+            buy_order, sell_order = resting, order
+        return Trade(next(self.trade_id_counter), symbol, buy_order, sell_order, quantity, price)
+
 
 # Account class representing a user's brokerage account
 class Account:
-    def __init__(self, account_id, user, initial_balance):
+    def __init__(self, account_id, user, initial_balance, lock=None):
         self.account_id = account_id
         self.user = user
         self.balance = initial_balance
+        self.lock = lock or RLock()
         self.portfolio = Portfolio(self)
+        self.observers = []
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def notify_observers(self):
+        for observer in self.observers:
+            observer.on_balance_change(self, self.balance)
 
     def deposit(self, amount):
-        self.balance += amount
+        with self.lock:
+            self.balance += amount
+            self.notify_observers()
 
     def withdraw(self, amount):
-        if self.balance >= amount:
-            self.balance -= amount
-        else:
-            raise InsufficientFundsException("Insufficient funds in the account.")
+        with self.lock:
+            if self.balance >= amount:
+                self.balance -= amount
+            else:
+                raise InsufficientFundsException("Insufficient funds in the account.")
+            self.notify_observers()
 
     def get_balance(self):
         return self.balance
@@ -135,6 +496,908 @@ class Account:
         return self.portfolio
 
 
+# MarketDataTable class holding the latest price of every symbol in one NumPy array
+class MarketDataTable:
+    def __init__(self, capacity=1024):
+        if np is None:
+            raise ImportError("MarketDataTable requires numpy.")
+        self.slots = {}
+        self.stocks = []
+        self.prices = np.full(capacity, np.nan)
+        # Set on the thread pushing a batch back into the Stock objects, so their updates are not written twice
+        self.batch = threading.local()
+        self.lock = Lock()
+
+    def track(self, stock):
+        slot = self.add_symbol(stock.get_symbol(), stock.get_price())
+        # The slot may predate the stock, e.g. opened unpriced for a holding
+        self.prices[slot] = stock.get_price()
+        self.stocks[slot] = stock
+        stock.add_observer(self)
+        return slot
+
+    def add_symbol(self, symbol, price=float("nan")):
+        with self.lock:
+            slot = self.slots.get(symbol)
+            if slot is None:
+                slot = len(self.stocks)
+                if slot == len(self.prices):
+                    self.prices = np.concatenate([self.prices, np.full(len(self.prices), np.nan)])
+                self.slots[symbol] = slot
+                self.stocks.append(None)
+                self.prices[slot] = price
+            return slot
+
+    def get_slot(self, symbol):
+        return self.slots.get(symbol)
+
+    def get_price(self, symbol):
+        return float(self.prices[self.slots[symbol]])
+
+    def get_prices(self):
+        return self.prices[:len(self.stocks)]
+
+    def on_price_update(self, stock, old_price, new_price):
+        if not getattr(self.batch, "applying", False):
+            self.prices[self.slots[stock.get_symbol()]] = new_price
+
+    def update_prices(self, symbols, prices):
+        slots = np.fromiter((self.slots[symbol] for symbol in symbols), dtype=np.intp, count=len(symbols))
+        self.update_slots(slots, prices)
+
+    def update_slots(self, slots, prices):
+        # Batched tick write; with repeated slots the last tick in the batch wins
+        slots = np.asarray(slots, dtype=np.intp)
+        prices = np.asarray(prices, dtype=np.float64)
+        reversed_slots = slots[::-1]
+        _, last = np.unique(reversed_slots, return_index=True)
+        latest = len(slots) - 1 - last
+        self.prices[slots[latest]] = prices[latest]
+        # Keep the Stock objects and their other observers in step with the batch
+        self.batch.applying = True
+        try:
+            for slot in slots[latest].tolist():
+                stock = self.stocks[slot]
+                if stock is not None:
+                    stock.update_price(float(self.prices[slot]))
+        finally:
+            self.batch.applying = False
+
+
+# HoldingsMatrix class keeping every account's holdings as sparse (row, slot, quantity) columns
+class HoldingsMatrix:
+    def __init__(self, market_data, capacity=1024):
+        self.market_data = market_data
+        self.account_rows = {}
+        self.account_ids = []
+        self.entries = {}
+        self.rows = np.zeros(capacity, dtype=np.intp)
+        self.slots = np.zeros(capacity, dtype=np.intp)
+        self.quantities = np.zeros(capacity, dtype=np.float64)
+        self.size = 0
+        self.lock = Lock()
+
+    def track(self, account):
+        with account.lock:
+            with self.lock:
+                if account.account_id not in self.account_rows:
+                    self.account_rows[account.account_id] = len(self.account_ids)
+                    self.account_ids.append(account.account_id)
+            for symbol, quantity in account.get_portfolio().get_holdings().items():
+                self.on_holding_change(account, symbol, quantity)
+            account.get_portfolio().add_observer(self)
+
+    def on_holding_change(self, account, symbol, quantity):
+        slot = self.market_data.get_slot(symbol)
+        if slot is None:
+            slot = self.market_data.add_symbol(symbol)
+        with self.lock:
+            key = (self.account_rows[account.account_id], slot)
+            index = self.entries.get(key)
+            if index is None:
+                index = self._append(key)
+            self.quantities[index] = quantity
+
+    def mark_to_market(self):
+        # One vectorized pass: value of each entry, then summed per account row; unpriced symbols count as 0
+        with self.lock:
+            size = self.size
+            prices = np.nan_to_num(self.market_data.prices[self.slots[:size]], nan=0.0)
+            return np.bincount(self.rows[:size], weights=self.quantities[:size] * prices,
+                               minlength=len(self.account_ids))
+
+    def _append(self, key):
+        if self.size == len(self.rows):
+            self.rows = np.concatenate([self.rows, np.zeros_like(self.rows)])
+            self.slots = np.concatenate([self.slots, np.zeros_like(self.slots)])
+            self.quantities = np.concatenate([self.quantities, np.zeros_like(self.quantities)])
+        index = self.size
+        self.rows[index], self.slots[index] = key
+        self.entries[key] = index
+        self.size += 1
+        return index
+
+
+# PortfolioValuationCache class keeping a cached value per account and a symbol->holders reverse index
+class PortfolioValuationCache:
+    def __init__(self):
+        self.holders = {}
+        self.values = {}
+        self.prices = {}
+        self.lock = Lock()
+
+    def track_stock(self, stock):
+        stock.add_observer(self)
+        self.on_price_update(stock, stock.get_price(), stock.get_price())
+
+    def track_account(self, account):
+        with account.lock:
+            with self.lock:
+                self.values.setdefault(account.account_id, 0.0)
+            for symbol, quantity in account.get_portfolio().get_holdings().items():
+                self.on_holding_change(account, symbol, quantity)
+            account.get_portfolio().add_observer(self)
+
+    def on_holding_change(self, account, symbol, quantity):
+        with self.lock:
+            holders = self.holders.setdefault(symbol, {})
+            delta = quantity - holders.get(account.account_id, 0)
+            if quantity:
+                holders[account.account_id] = quantity
+            else:
+                holders.pop(account.account_id, None)
+            self.values[account.account_id] = self.values.get(account.account_id, 0.0) + delta * self.prices.get(symbol, 0.0)
+
+    def on_price_update(self, stock, old_price, new_price):
+        # Only the holders of this symbol are touched, each by delta x quantity
+        symbol = stock.get_symbol()
+        with self.lock:
+            delta = new_price - self.prices.get(symbol, 0.0)
+            self.prices[symbol] = new_price
+            if delta:
+                values = self.values
+                for account_id, quantity in self.holders.get(symbol, {}).items():
+                    values[account_id] += delta * quantity
+
+    def get_value(self, account_id):
+        return self.values.get(account_id)
+
+    def get_holders(self, symbol):
+        return dict(self.holders.get(symbol, {}))
+
+    def revalue(self, account):
+        # Full recompute for one account, clears any floating point drift from incremental updates
+        with account.lock:
+            with self.lock:
+                self.values[account.account_id] = sum(quantity * self.prices.get(symbol, 0.0)
+                                                      for symbol, quantity in account.get_portfolio().get_holdings().items())
+                return self.values[account.account_id]
+
+
+# Enum for Journal Record Types
+class JournalRecordType(Enum):
+    ACCOUNT = 1
+    STOCK = 2
+    ORDER = 3
+    ORDER_REPLACED = 4
+    EXECUTION = 5
+    ORDER_CLOSED = 6
+    BALANCE = 7
+    HOLDING = 8
+
+
+# OrderJournal class appending group-committed record batches to segment files
+class OrderJournal(OrderEventObserver):
+    # Each group commit is one frame: crc32 and length of a pickled (first lsn, [(record type, *fields), ...]);
+    # lsns are contiguous, so a record's lsn is its position after the first
+    FRAME_HEADER = struct.Struct("<II")
+    RECORD_TYPE = itemgetter(0)
+    # Record type values for the per-order observers, Enum member and value lookups are Python-level on 3.11
+    ORDER_RECORD = JournalRecordType.ORDER.value
+    ORDER_REPLACED_RECORD = JournalRecordType.ORDER_REPLACED.value
+    EXECUTION_RECORD = JournalRecordType.EXECUTION.value
+    ORDER_CLOSED_RECORD = JournalRecordType.ORDER_CLOSED.value
+    SNAPSHOT_FILE = "snapshot.json"
+
+    def __init__(self, directory, settlement=None, commit_interval=0.01):
+        self.directory = directory
+        self.settlement = settlement or SettlementState()
+        # The flusher syncs at most once per commit_interval seconds, everything appended meanwhile shares it
+        self.commit_interval = commit_interval
+        os.makedirs(directory, exist_ok=True)
+        # Last lsn numbered and last lsn on disk; only the flusher advances them once it runs
+        self.lsn = 0
+        self.durable_lsn = 0
+        # Records and durability markers in append order. deque.append is atomic, so appending takes no lock;
+        # the flusher numbers the records as it drains them
+        self.buffer = deque()
+        self.idle = False
+        self.file = None
+        self.rotate_requested = False
+        self.rotations = 0
+        self.closed = False
+        self.lock = Lock()
+        self.pending = Condition(self.lock)
+        self.rotated = Condition(self.lock)
+        self.flusher = None
+
+    def start(self):
+        self.flusher = Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.pending.notify()
+        if self.flusher is not None:
+            self.flusher.join()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def append(self, record_type, *fields):
+        self._append((record_type.value,) + fields)
+
+    def resolve_when_durable(self, future, result=None):
+        # Completes the future once every record appended before this call is on disk, with result or, when there
+        # is none, with the lsn of the last of those records
+        self._append((None, future, result))
+
+    def rotate(self):
+        # Returns once the flusher has closed the current segment and opened the next one
+        with self.lock:
+            rotations = self.rotations
+            self.rotate_requested = True
+            self.pending.notify()
+            while self.rotations == rotations and not self.closed:
+                self.rotated.wait()
+
+    def read_records(self, after_lsn=0):
+        # Yields (lsn, record type, fields) in order; a torn frame left by a crash is truncated away
+        for first_lsn, path in self._segments():
+            with open(path, "rb") as segment:
+                data = segment.read()
+            offset = 0
+            while offset + self.FRAME_HEADER.size <= len(data):
+                crc, length = self.FRAME_HEADER.unpack_from(data, offset)
+                start = offset + self.FRAME_HEADER.size
+                frame = data[start:start + length]
+                if len(frame) < length or zlib.crc32(frame) != crc:
+                    break
+                first_lsn, records = pickle.loads(frame)
+                for lsn, record in enumerate(records, first_lsn):
+                    if lsn > after_lsn:
+                        yield lsn, JournalRecordType(record[0]), record[1:]
+                self.lsn = max(self.lsn, first_lsn + len(records) - 1)
+                offset = start + length
+            if offset < len(data):
+                with open(path, "r+b") as segment:
+                    segment.truncate(offset)
+        self.durable_lsn = self.lsn
+
+    def write_snapshot(self, state):
+        path = os.path.join(self.directory, self.SNAPSHOT_FILE)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as snapshot:
+            json.dump(state, snapshot)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(temp_path, path)
+
+    def load_snapshot(self):
+        path = os.path.join(self.directory, self.SNAPSHOT_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as snapshot:
+            return json.load(snapshot)
+
+    def discard_through(self, lsn):
+        # Deletes segments whose records are all covered by a snapshot taken at lsn
+        segments = self._segments()
+        for (first_lsn, path), (next_first_lsn, _) in zip(segments, segments[1:]):
+            if next_first_lsn <= lsn + 1:
+                os.remove(path)
+
+    # The per-order observers build their records directly; _value_ is the plain attribute behind Enum.value
+    def on_order_accepted(self, order):
+        self._append((self.ORDER_RECORD, order.order_id, order.account.account_id, order.stock.symbol,
+                      order.side._value_, order.quantity, order.price))
+
+    def on_order_replaced(self, order):
+        self._append((self.ORDER_REPLACED_RECORD, order.order_id, order.quantity, order.price))
+
+    def on_trade(self, trade):
+        self._append((self.EXECUTION_RECORD, trade.trade_id, trade.symbol, trade.buy_order.order_id,
+                      trade.sell_order.order_id, trade.quantity, trade.price))
+
+    def on_order_closed(self, order):
+        # Fully filled orders are closed implicitly by their executions
+        if order.status is not OrderStatus.EXECUTED:
+            self._append((self.ORDER_CLOSED_RECORD, order.order_id, order.status._value_))
+
+    def on_balance_change(self, account, balance):
+        # Settlement changes are replayed from EXECUTION records, only out-of-band changes are journaled
+        if not self.settlement.settling:
+            self.append(JournalRecordType.BALANCE, account.account_id, balance)
+
+    def on_holding_change(self, account, symbol, quantity):
+        if not self.settlement.settling:
+            self.append(JournalRecordType.HOLDING, account.account_id, symbol, quantity)
+
+    def _append(self, record):
+        # Records that must be ordered are appended under the locks of the state they change
+        self.buffer.append(record)
+        # Only an idle flusher needs waking, one inside its commit window picks the record up anyway
+        if self.idle:
+            self._wake()
+
+    def _wake(self):
+        with self.lock:
+            self.idle = False
+            self.pending.notify()
+
+    def _flush_loop(self):
+        last_sync = 0.0
+        while True:
+            with self.lock:
+                # idle is raised before the buffer is checked, so an appender either sees it or is seen
+                while True:
+                    self.idle = True
+                    if self.buffer or self.rotate_requested or self.closed:
+                        break
+                    self.pending.wait()
+                self.idle = False
+                while not self.rotate_requested and not self.closed:
+                    remaining = last_sync + self.commit_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.pending.wait(remaining)
+                if not self.buffer and not self.rotate_requested:
+                    return
+                rotate, self.rotate_requested = self.rotate_requested, False
+            # Everything appended since the previous fsync is committed as one group. Markers are the only entries
+            # without a record type, so records and markers are split apart without a Python-level loop
+            popleft = self.buffer.popleft
+            drained = [popleft() for _ in range(len(self.buffer))]
+            batch = list(filter(self.RECORD_TYPE, drained))
+            markers = list(itertools.filterfalse(self.RECORD_TYPE, drained)) if len(batch) < len(drained) else []
+            first_lsn = self.lsn + 1
+            self.lsn += len(batch)
+            waiting = []
+            for position, marker in enumerate(markers):
+                _, future, result = marker
+                if result is None:
+                    # Records ahead of the marker are the entries ahead of it less the markers among them
+                    result = first_lsn - 1 + drained.index(marker) - position
+                waiting.append((future, result))
+            if rotate:
+                # The next segment is opened right away, so the closed one can be discarded without waiting for
+                # another record; lsns are contiguous, so it is named after the lsn that follows the durable tail
+                if self.file is not None:
+                    self.file.close()
+                self.file = open(os.path.join(self.directory, f"journal-{self.durable_lsn + 1:020d}.log"), "ab")
+                with self.lock:
+                    self.rotations += 1
+                    self.rotated.notify_all()
+            if not batch:
+                # Everything before these markers was made durable by an earlier commit
+                for future, result in waiting:
+                    future.set_result(result)
+                continue
+            if self.file is None:
+                self.file = open(os.path.join(self.directory, f"journal-{first_lsn:020d}.log"), "ab")
+            frame = pickle.dumps((first_lsn, batch), protocol=pickle.HIGHEST_PROTOCOL)
+            self.file.write(self.FRAME_HEADER.pack(zlib.crc32(frame), len(frame)) + frame)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            last_sync = time.monotonic()
+            self.durable_lsn = self.lsn
+            for future, result in waiting:
+                future.set_result(result)
+
+    def _segments(self):
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith("journal-") and name.endswith(".log"):
+                segments.append((int(name[len("journal-"):-len(".log")]), os.path.join(self.directory, name)))
+        return sorted(segments)
+
+
+# RiskLimits class holding the pre-trade limits applied to an account
+class RiskLimits:
+    def __init__(self, max_order_notional=float("inf"), max_open_orders=float("inf"),
+                 max_account_exposure=float("inf"), max_symbol_exposure=float("inf")):
+        self.max_order_notional = max_order_notional
+        self.max_open_orders = max_open_orders
+        self.max_account_exposure = max_account_exposure
+        self.max_symbol_exposure = max_symbol_exposure
+
+
+# PreTradeRiskEngine class checking orders against incrementally maintained open-order exposure
+class PreTradeRiskEngine(OrderEventObserver):
+    def __init__(self, default_limits=None):
+        self.default_limits = default_limits or RiskLimits()
+        self.account_limits = {}
+        # Firm-wide caps per symbol; RiskLimits.max_symbol_exposure caps one account's exposure to a symbol
+        self.symbol_limits = {}
+        # Open-order notional per account, per (account, symbol) and per symbol, and open order counts per account
+        self.account_exposure = {}
+        self.account_symbol_exposure = {}
+        self.symbol_exposure = {}
+        self.open_orders = {}
+        # order_id -> [account_id, symbol, reserved notional]
+        self.reservations = {}
+        self.lock = Lock()
+
+    def set_account_limits(self, account_id, limits):
+        self.account_limits[account_id] = limits
+
+    def set_symbol_limit(self, symbol, max_exposure):
+        self.symbol_limits[symbol] = max_exposure
+
+    def check(self, order):
+        # O(1): a handful of dict lookups against precomputed limits, then the exposure is reserved
+        account_id = order.account.account_id
+        symbol = order.stock.symbol
+        notional = (order.quantity - order.filled_quantity) * order.price
+        limits = self.account_limits.get(account_id, self.default_limits)
+        if notional > limits.max_order_notional:
+            raise RiskLimitExceededException("Order notional exceeds the maximum order notional.")
+        with self.lock:
+            # A second order under a live id would overwrite, and later release, the live order's reservation
+            if order.order_id in self.reservations:
+                raise ValueError(f"Duplicate order id {order.order_id}.")
+            open_orders = self.open_orders.get(account_id, 0)
+            account_exposure = self.account_exposure.get(account_id, 0.0) + notional
+            account_symbol_exposure = self.account_symbol_exposure.get((account_id, symbol), 0.0) + notional
+            symbol_exposure = self.symbol_exposure.get(symbol, 0.0) + notional
+            if open_orders >= limits.max_open_orders:
+                raise RiskLimitExceededException("Too many open orders on the account.")
+            if account_exposure > limits.max_account_exposure:
+                raise RiskLimitExceededException("Order exceeds the account exposure limit.")
+            if account_symbol_exposure > limits.max_symbol_exposure:
+                raise RiskLimitExceededException("Order exceeds the account's symbol exposure limit.")
+            if symbol_exposure > self.symbol_limits.get(symbol, float("inf")):
+                raise RiskLimitExceededException("Order exceeds the firm-wide symbol exposure limit.")
+            self.open_orders[account_id] = open_orders + 1
+            self.account_exposure[account_id] = account_exposure
+            self.account_symbol_exposure[(account_id, symbol)] = account_symbol_exposure
+            self.symbol_exposure[symbol] = symbol_exposure
+            self.reservations[order.order_id] = [account_id, symbol, notional]
+
+    def check_replace(self, order, quantity, price):
+        account_id = order.account.account_id
+        symbol = order.stock.symbol
+        notional = (quantity - order.filled_quantity) * price
+        limits = self.account_limits.get(account_id, self.default_limits)
+        if notional > limits.max_order_notional:
+            raise RiskLimitExceededException("Order notional exceeds the maximum order notional.")
+        with self.lock:
+            reservation = self.reservations.get(order.order_id)
+            delta = notional - (reservation[2] if reservation else 0.0)
+            if self.account_exposure.get(account_id, 0.0) + delta > limits.max_account_exposure:
+                raise RiskLimitExceededException("Order exceeds the account exposure limit.")
+            if self.account_symbol_exposure.get((account_id, symbol), 0.0) + delta > limits.max_symbol_exposure:
+                raise RiskLimitExceededException("Order exceeds the account's symbol exposure limit.")
+            if self.symbol_exposure.get(symbol, 0.0) + delta > self.symbol_limits.get(symbol, float("inf")):
+                raise RiskLimitExceededException("Order exceeds the firm-wide symbol exposure limit.")
+
+    def release(self, order):
+        with self.lock:
+            reservation = self.reservations.pop(order.order_id, None)
+            if reservation is not None:
+                account_id, symbol, reserved = reservation
+                self._adjust(account_id, symbol, -reserved)
+                self.open_orders[account_id] -= 1
+
+    def get_account_exposure(self, account_id):
+        return self.account_exposure.get(account_id, 0.0)
+
+    def get_account_symbol_exposure(self, account_id, symbol):
+        return self.account_symbol_exposure.get((account_id, symbol), 0.0)
+
+    def get_symbol_exposure(self, symbol):
+        return self.symbol_exposure.get(symbol, 0.0)
+
+    def get_open_orders(self, account_id):
+        return self.open_orders.get(account_id, 0)
+
+    def on_order_replaced(self, order):
+        with self.lock:
+            reservation = self.reservations.get(order.order_id)
+            if reservation is not None:
+                notional = order.get_remaining_quantity() * order.price
+                self._adjust(reservation[0], reservation[1], notional - reservation[2])
+                reservation[2] = notional
+
+    def on_trade(self, trade):
+        with self.lock:
+            for order in (trade.buy_order, trade.sell_order):
+                reservation = self.reservations.get(order.order_id)
+                if reservation is not None:
+                    # Exposure was reserved at the order's limit price, so it is released at that price
+                    filled = min(trade.quantity * order.price, reservation[2])
+                    self._adjust(reservation[0], reservation[1], -filled)
+                    reservation[2] -= filled
+
+    def on_order_closed(self, order):
+        self.release(order)
+
+    def _adjust(self, account_id, symbol, delta):
+        self.account_exposure[account_id] += delta
+        self.account_symbol_exposure[(account_id, symbol)] += delta
+        self.symbol_exposure[symbol] += delta
+
+
+# OHLCVBar class representing one open/high/low/close/volume bar
+class OHLCVBar:
+    def __init__(self, start, open_price, high, low, close, volume):
+        self.start = start
+        self.open = open_price
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+
+# BarRingBuffer class keeping the most recent bars of one symbol and interval in fixed-size columns
+class BarRingBuffer:
+    def __init__(self, interval, capacity):
+        self.interval = interval
+        self.capacity = capacity
+        self.starts = array("d", [0.0]) * capacity
+        self.opens = array("d", [0.0]) * capacity
+        self.highs = array("d", [0.0]) * capacity
+        self.lows = array("d", [0.0]) * capacity
+        self.closes = array("d", [0.0]) * capacity
+        self.volumes = array("d", [0.0]) * capacity
+        self.head = -1
+        self.count = 0
+        self.late_dropped = 0
+
+    def update(self, timestamp, price, quantity):
+        start = timestamp - timestamp % self.interval
+        head = self.head
+        if self.count and self.starts[head] == start:
+            if price > self.highs[head]:
+                self.highs[head] = price
+            if price < self.lows[head]:
+                self.lows[head] = price
+            self.closes[head] = price
+            self.volumes[head] += quantity
+            return
+        if self.count and start < self.starts[head]:
+            self._update_late(start, price, quantity)
+            return
+        head = (head + 1) % self.capacity
+        self.head = head
+        self.count = min(self.count + 1, self.capacity)
+        self.starts[head] = start
+        self.opens[head] = self.highs[head] = self.lows[head] = self.closes[head] = price
+        self.volumes[head] = quantity
+
+    def _update_late(self, start, price, quantity):
+        # Late print for a bar that already rolled over: folded into its own bar if that is still in the ring,
+        # never into the current one. Its close is left alone, later prints for that bar already set it
+        for offset in range(1, self.count):
+            i = (self.head - offset) % self.capacity
+            if self.starts[i] == start:
+                if price > self.highs[i]:
+                    self.highs[i] = price
+                if price < self.lows[i]:
+                    self.lows[i] = price
+                self.volumes[i] += quantity
+                return
+            if self.starts[i] < start:
+                break
+        # No bar for that interval (it had no prints, or has left the ring)
+        self.late_dropped += 1
+
+    def last(self, count):
+        # Oldest first, touching only the bars returned
+        count = min(count, self.count)
+        bars = []
+        for offset in range(count - 1, -1, -1):
+            i = (self.head - offset) % self.capacity
+            bars.append(OHLCVBar(self.starts[i], self.opens[i], self.highs[i], self.lows[i], self.closes[i],
+                                 self.volumes[i]))
+        return bars
+
+
+# OHLCVBarAggregator class building rolling bars per symbol from executions and price updates
+class OHLCVBarAggregator(OrderEventObserver):
+    def __init__(self, intervals=(1, 60, 300), capacity=1000, settlement=None):
+        self.intervals = intervals
+        self.capacity = capacity
+        self.settlement = settlement or SettlementState()
+        self.buffers = {}
+        self.lock = Lock()
+
+    def track_stock(self, stock):
+        stock.add_observer(self)
+
+    def on_trade(self, trade):
+        self.record(trade.symbol, trade.price, trade.quantity, trade.timestamp.timestamp())
+
+    def on_price_update(self, stock, old_price, new_price):
+        # A fill's own price update is skipped, the fill was already recorded by on_trade
+        if not self.settlement.settling:
+            self.record(stock.get_symbol(), new_price, 0, time.time())
+
+    def record(self, symbol, price, quantity, timestamp):
+        with self.lock:
+            buffers = self.buffers.get(symbol)
+            if buffers is None:
+                buffers = {interval: BarRingBuffer(interval, self.capacity) for interval in self.intervals}
+                self.buffers[symbol] = buffers
+            for buffer in buffers.values():
+                buffer.update(timestamp, price, quantity)
+
+    def get_bars(self, symbol, interval, count):
+        with self.lock:
+            buffers = self.buffers.get(symbol)
+            if buffers is None:
+                return []
+            return buffers[interval].last(count)
+
+
+# OrderRecord class, a read-only view of one row of the order history
+class OrderRecord:
+    def __init__(self, order_id, account_id, symbol, side, quantity, filled_quantity, price, average_price, status,
+                 created_at, updated_at):
+        self.order_id = order_id
+        self.account_id = account_id
+        self.symbol = symbol
+        self.side = side
+        self.quantity = quantity
+        self.filled_quantity = filled_quantity
+        self.price = price
+        self.average_price = average_price
+        self.status = status
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+
+# OrderHistoryStore class keeping every order in compact columns with account, symbol and status indexes
+class OrderHistoryStore(OrderEventObserver):
+    def __init__(self):
+        # Row ids are assigned in acceptance order, so created_at is non-decreasing by row
+        self.rows = {}
+        self.order_ids = []
+        self.accounts = array("I")
+        self.symbols = array("I")
+        self.sides = array("b")
+        self.statuses = array("b")
+        self.quantities = array("q")
+        self.filled_quantities = array("q")
+        self.prices = array("d")
+        self.notionals = array("d")
+        self.created_at = array("d")
+        self.updated_at = array("d")
+        # Account ids and symbols are interned to small integer codes
+        self.account_codes = {}
+        self.account_ids = []
+        self.symbol_codes = {}
+        self.symbol_names = []
+        # Every index holds ascending row ids; status lists may hold stale rows that are filtered on read
+        self.by_account = {}
+        self.by_symbol = {}
+        self.by_status = {status.value: array("I") for status in OrderStatus}
+        self.status_counts = {status.value: 0 for status in OrderStatus}
+        self.last_timestamp = 0.0
+        self.lock = Lock()
+
+    def on_order_accepted(self, order):
+        with self.lock:
+            if order.order_id not in self.rows:
+                self._insert(order)
+
+    def on_order_replaced(self, order):
+        with self.lock:
+            row = self.rows.get(order.order_id)
+            if row is None:
+                return
+            self.quantities[row] = order.quantity
+            self.prices[row] = order.price
+            self.updated_at[row] = self._now()
+
+    def on_trade(self, trade):
+        with self.lock:
+            for order in (trade.buy_order, trade.sell_order):
+                row = self.rows.get(order.order_id)
+                if row is None:
+                    continue
+                self.filled_quantities[row] = order.filled_quantity
+                self.notionals[row] += trade.quantity * trade.price
+                self._set_status(row, order.status)
+
+    def on_order_closed(self, order):
+        with self.lock:
+            row = self.rows.get(order.order_id)
+            if row is not None:
+                self._set_status(row, order.status)
+
+    def record_rejected(self, order):
+        # Orders rejected before acceptance never reach the engine's observers
+        with self.lock:
+            if order.order_id not in self.rows:
+                self._insert(order)
+
+    def get_order(self, order_id):
+        with self.lock:
+            row = self.rows.get(order_id)
+            return None if row is None else self._record(row)
+
+    def get_order_count(self):
+        return len(self.order_ids)
+
+    def query(self, account_id=None, symbol=None, status=None, start_time=None, end_time=None, cursor=None,
+              limit=100):
+        # Returns (records, next_cursor); pass next_cursor back to fetch the following page
+        with self.lock:
+            candidates = []
+            if account_id is not None:
+                code = self.account_codes.get(account_id)
+                candidates.append(self.by_account.get(code, ()) if code is not None else ())
+            if symbol is not None:
+                code = self.symbol_codes.get(symbol)
+                candidates.append(self.by_symbol.get(code, ()) if code is not None else ())
+            if status is not None:
+                candidates.append(self.by_status[status.value])
+            # Walk the smallest index and check the remaining filters per row
+            rows = min(candidates, key=len) if candidates else range(len(self.order_ids))
+            created_at = self.created_at
+            low = 0
+            high = len(rows)
+            if start_time is not None:
+                low = bisect.bisect_left(rows, start_time, key=created_at.__getitem__)
+            if end_time is not None:
+                high = bisect.bisect_left(rows, end_time, low, high, key=created_at.__getitem__)
+            if cursor is not None:
+                low = max(low, bisect.bisect_right(rows, cursor, low, high))
+            account_code = self.account_codes.get(account_id) if account_id is not None else None
+            symbol_code = self.symbol_codes.get(symbol) if symbol is not None else None
+            status_code = status.value if status is not None else None
+            records = []
+            last_row = None
+            for index in range(low, high):
+                row = rows[index]
+                if status_code is not None and self.statuses[row] != status_code:
+                    continue
+                if account_code is not None and self.accounts[row] != account_code:
+                    continue
+                if symbol_code is not None and self.symbols[row] != symbol_code:
+                    continue
+                if len(records) == limit:
+                    return records, last_row
+                records.append(self._record(row))
+                last_row = row
+            return records, None
+
+    def _insert(self, order):
+        row = len(self.order_ids)
+        self.rows[order.order_id] = row
+        self.order_ids.append(order.order_id)
+        account_code = self._intern(order.account.account_id, self.account_codes, self.account_ids)
+        symbol_code = self._intern(order.stock.get_symbol(), self.symbol_codes, self.symbol_names)
+        now = self._now()
+        self.accounts.append(account_code)
+        self.symbols.append(symbol_code)
+        self.sides.append(order.side.value)
+        self.statuses.append(order.status.value)
+        self.quantities.append(order.quantity)
+        self.filled_quantities.append(order.filled_quantity)
+        self.prices.append(order.price)
+        self.notionals.append(0.0)
+        self.created_at.append(now)
+        self.updated_at.append(now)
+        self.by_account.setdefault(account_code, array("I")).append(row)
+        self.by_symbol.setdefault(symbol_code, array("I")).append(row)
+        self.by_status[order.status.value].append(row)
+        self.status_counts[order.status.value] += 1
+
+    def _set_status(self, row, status):
+        self.updated_at[row] = self._now()
+        previous = self.statuses[row]
+        if previous == status.value:
+            return
+        self.statuses[row] = status.value
+        self.status_counts[previous] -= 1
+        self.status_counts[status.value] += 1
+        # Transitions mostly hit recent rows, so the insert lands near the tail of the index
+        index = self.by_status[status.value]
+        index.insert(bisect.bisect_left(index, row), row)
+        stale = self.by_status[previous]
+        if len(stale) > 2 * self.status_counts[previous] + 1024:
+            self.by_status[previous] = array("I", (r for r in stale if self.statuses[r] == previous))
+
+    def _now(self):
+        # Clamped so a wall clock step backwards cannot unsort created_at
+        self.last_timestamp = max(self.last_timestamp, time.time())
+        return self.last_timestamp
+
+    def _record(self, row):
+        filled_quantity = self.filled_quantities[row]
+        return OrderRecord(self.order_ids[row], self.account_ids[self.accounts[row]],
+                           self.symbol_names[self.symbols[row]], OrderSide(self.sides[row]), self.quantities[row],
+                           filled_quantity, self.prices[row],
+                           self.notionals[row] / filled_quantity if filled_quantity else None,
+                           OrderStatus(self.statuses[row]), self.created_at[row], self.updated_at[row])
+
+    @staticmethod
+    def _intern(value, codes, values):
+        code = codes.get(value)
+        if code is None:
+            code = len(values)
+            codes[value] = code
+            values.append(value)
+        return code
+
+
+# AccountLockStriping class mapping account ids onto a fixed set of reentrant locks
+class AccountLockStriping:
+    def __init__(self, num_stripes=64):
+        self.locks = [RLock() for _ in range(num_stripes)]
+
+    def stripe_index(self, account_id):
+        return hash(account_id) % len(self.locks)
+
+    def get_lock(self, account_id):
+        return self.locks[self.stripe_index(account_id)]
+
+    @contextmanager
+    def acquire(self, *accounts):
+        # Deterministic order (stripe index, then account id) so two-account settlements never deadlock
+        ordered = sorted(accounts, key=lambda account: (self.stripe_index(account.account_id), account.account_id))
+        locks = []
+        for account in ordered:
+            if not any(lock is account.lock for lock in locks):
+                locks.append(account.lock)
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+
+# OrderWorkerPool class running orders on single-threaded lanes keyed by account id
+class OrderWorkerPool:
+    def __init__(self, num_workers, resolve=None):
+        # One thread per lane keeps orders of the same account serialized
+        self.resolve = resolve or Future.set_result
+        self.lanes = [SimpleQueue() for _ in range(num_workers)]
+        self.threads = [Thread(target=self._run_lane, args=(lane,), daemon=True) for lane in self.lanes]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, key, fn, *args):
+        future = Future()
+        self.lanes[hash(key) % len(self.lanes)].put((fn, args, future))
+        return future
+
+    def shutdown(self, wait=True):
+        for lane in self.lanes:
+            lane.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+    def _run_lane(self, lane):
+        while True:
+            task = lane.get()
+            if task is None:
+                return
+            fn, args, future = task
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                self.resolve(future, result)
+
+
 # StockBroker class for managing accounts, stocks, and orders
 class StockBroker:
     _instance = None
@@ -148,42 +1411,473 @@ class StockBroker:
                     cls._instance.accounts = {}
                     cls._instance.stocks = {}
                     cls._instance.order_queue = Queue()
+                    cls._instance.account_locks = AccountLockStriping()
+                    cls._instance.matching_engine = MatchingEngine(cls._instance.account_locks)
+                    cls._instance.order_workers = None
+                    cls._instance.market_data = None
+                    cls._instance.holdings_matrix = None
+                    cls._instance.valuation = PortfolioValuationCache()
+                    cls._instance.journal = None
+                    cls._instance.risk_engine = None
+                    cls._instance.bar_aggregator = None
+                    cls._instance.order_history = None
+                    cls._instance.snapshot_stop = None
+                    cls._instance.snapshot_thread = None
                     cls._instance.account_id_counter = 1
         return cls._instance
 
     def create_account(self, user, initial_balance):
         account_id = self._generate_account_id()
-        account = Account(account_id, user, initial_balance)
-        self.accounts[account_id] = account
+        account = Account(account_id, user, initial_balance, self.account_locks.get_lock(account_id))
+        self._register_account(account)
+        return account
 
     def get_account(self, account_id):
         return self.accounts.get(account_id)
 
     def add_stock(self, stock):
-        self.stocks[stock.get_symbol()] = stock
+        with self._lock:
+            self.stocks[stock.get_symbol()] = stock
+            self.valuation.track_stock(stock)
+            if self.market_data is not None:
+                self.market_data.track(stock)
+            if self.bar_aggregator is not None:
+                self.bar_aggregator.track_stock(stock)
+            if self.journal is not None:
+                self.journal.append(JournalRecordType.STOCK, stock.get_symbol(), stock.get_name(), stock.get_price())
 
     def get_stock(self, symbol):
         return self.stocks.get(symbol)
 
+    def get_portfolio_value(self, account_id):
+        return self.valuation.get_value(account_id)
+
+    def get_holders(self, symbol):
+        return self.valuation.get_holders(symbol)
+
+    def get_market_data(self):
+        with self._lock:
+            if self.market_data is None:
+                self.market_data = MarketDataTable()
+                for stock in list(self.stocks.values()):
+                    self.market_data.track(stock)
+        return self.market_data
+
+    def apply_ticks(self, symbols, prices):
+        self.get_market_data().update_prices(symbols, prices)
+
+    def mark_to_market(self):
+        # The holdings matrix is built once, then kept current by portfolio notifications
+        market_data = self.get_market_data()
+        with self._lock:
+            if self.holdings_matrix is None:
+                self.holdings_matrix = HoldingsMatrix(market_data)
+                for account in list(self.accounts.values()):
+                    self.holdings_matrix.track(account)
+        return self.holdings_matrix.account_ids, self.holdings_matrix.mark_to_market()
+
+    def start_order_workers(self, num_workers):
+        if self.order_workers is None:
+            self.order_workers = OrderWorkerPool(num_workers, self._resolve_order)
+
+    def shutdown(self):
+        if self.order_workers is not None:
+            self.order_workers.shutdown()
+            self.order_workers = None
+
+    def enable_journal(self, directory, snapshot_interval=None):
+        # Recovers from the last snapshot plus the journal tail, then journals every state change
+        journal = OrderJournal(directory, self.matching_engine.settlement)
+        self._recover(journal)
+        self.journal = journal
+        # First in line, so observers that wait on durability run after the event's record is appended
+        self.matching_engine.observers.insert(0, journal)
+        for account in list(self.accounts.values()):
+            account.add_observer(journal)
+            account.get_portfolio().add_observer(journal)
+        journal.start()
+        # Stocks and accounts that predate the journal have no records, a base snapshot makes them recoverable
+        self.snapshot()
+        if snapshot_interval:
+            self.snapshot_stop = Event()
+            self.snapshot_thread = Thread(target=self._snapshot_loop, args=(snapshot_interval, self.snapshot_stop),
+                                          daemon=True)
+            self.snapshot_thread.start()
+
+    def disable_journal(self):
+        journal = self.journal
+        if journal is None:
+            return
+        if self.snapshot_stop is not None:
+            # A snapshot in flight still writes and discards segments, it must finish before the journal closes
+            self.snapshot_stop.set()
+            self.snapshot_thread.join()
+            self.snapshot_stop = self.snapshot_thread = None
+        self.journal = None
+        self.matching_engine.observers.remove(journal)
+        for account in list(self.accounts.values()):
+            account.observers.remove(journal)
+            account.get_portfolio().observers.remove(journal)
+        journal.close()
+
+    def snapshot(self):
+        # Freezes books and accounts in lock order so the captured state matches the journal position exactly
+        journal = self.journal
+        if journal is None:
+            return None
+        with ExitStack() as stack:
+            stack.enter_context(self._lock)
+            stack.enter_context(self.matching_engine.lock)
+            for symbol in sorted(self.matching_engine.order_books):
+                stack.enter_context(self.matching_engine.order_books[symbol].lock)
+            for lock in self.account_locks.locks:
+                stack.enter_context(lock)
+            # The marker's lsn is that of the last record appended before the state was frozen
+            position = Future()
+            journal.resolve_when_durable(position)
+            state = {
+                "account_id_counter": self.account_id_counter,
+                "stocks": [[stock.get_symbol(), stock.get_name(), stock.get_price()] for stock in self.stocks.values()],
+                "accounts": [[account.account_id, account.user.user_id, account.user.name, account.user.email,
+                              account.get_balance(), dict(account.get_portfolio().get_holdings())]
+                             for account in self.accounts.values()],
+                "open_orders": [[order.order_id, order.account.account_id, order.stock.get_symbol(), order.side.value,
+                                 order.quantity, order.filled_quantity, order.price]
+                                for book in self.matching_engine.order_books.values()
+                                for order in book.orders.values()],
+            }
+        # The snapshot may only claim lsns that are on disk, or a crash would let recovery reuse them
+        lsn = state["lsn"] = position.result()
+        journal.write_snapshot(state)
+        journal.rotate()
+        journal.discard_through(lsn)
+        return lsn
+
     def place_order(self, order):
+        # With workers started, orders run on the account's lane and a Future of the OrderStatus is returned
+        if self.order_workers is not None:
+            return self.order_workers.submit(order.account.account_id, self._execute_order, order)
         self.order_queue.put(order)
         self._process_orders()
+        journal = self.journal
+        if journal is not None:
+            # The caller is not held for the fsync, the Future completes once the order's records are durable
+            future = Future()
+            journal.resolve_when_durable(future, order.status)
+            return future
+
+    def enable_risk_checks(self, default_limits=None):
+        if self.risk_engine is None:
+            self.risk_engine = PreTradeRiskEngine(default_limits)
+            self.matching_engine.add_observer(self.risk_engine)
+        return self.risk_engine
+
+    def enable_bar_aggregation(self, intervals=(1, 60, 300), capacity=1000):
+        with self._lock:
+            if self.bar_aggregator is None:
+                self.bar_aggregator = OHLCVBarAggregator(intervals, capacity, self.matching_engine.settlement)
+                for stock in self.stocks.values():
+                    self.bar_aggregator.track_stock(stock)
+                self.matching_engine.add_observer(self.bar_aggregator)
+        return self.bar_aggregator
+
+    def get_bars(self, symbol, interval, count):
+        if self.bar_aggregator is None:
+            return []
+        return self.bar_aggregator.get_bars(symbol, interval, count)
+
+    def enable_order_history(self):
+        with self._lock:
+            if self.order_history is None:
+                self.order_history = OrderHistoryStore()
+                self.matching_engine.add_observer(self.order_history)
+        return self.order_history
+
+    def get_order_history(self):
+        return self.order_history
+
+    def submit_order(self, order):
+        # Pre-trade risk runs in front of matching; a rejected order never reaches the book
+        risk_engine = self.risk_engine
+        if risk_engine is not None:
+            try:
+                risk_engine.check(order)
+            except RiskLimitExceededException:
+                order.status = OrderStatus.REJECTED
+                if self.order_history is not None:
+                    self.order_history.record_rejected(order)
+                raise
+        try:
+            return self.matching_engine.submit(order)
+        except Exception:
+            if risk_engine is not None:
+                risk_engine.release(order)
+            if self.order_history is not None and order.status == OrderStatus.REJECTED:
+                self.order_history.record_rejected(order)
+            raise
+
+    def cancel_order(self, order_id):
+        return self.matching_engine.cancel_order(order_id)
+
+    def replace_order(self, order_id, quantity=None, price=None):
+        try:
+            if self.risk_engine is not None:
+                book = self.matching_engine.order_index.get(order_id)
+                order = book.get_order(order_id) if book is not None else None
+                if order is not None:
+                    self.risk_engine.check_replace(order, order.quantity if quantity is None else quantity,
+                                                   order.price if price is None else price)
+            return self.matching_engine.replace_order(order_id, quantity, price)
+        except (InsufficientFundsException, InsufficientStockException, RiskLimitExceededException) as e:
+            print(f"Order replace failed: {str(e)}")
+            return None
+
+    def get_order_book(self, symbol):
+        return self.matching_engine.get_order_book(symbol)
 
     def _process_orders(self):
-        while not self.order_queue.empty():
-            order = self.order_queue.get()
+        while True:
             try:
-                order.execute()
-            except (InsufficientFundsException, InsufficientStockException) as e:
-                # Handle exception and notify user
-                print(f"Order failed: {str(e)}")
+                order = self.order_queue.get_nowait()
+            except Empty:
+                return
+            self._execute_order(order)
+
+    def _execute_order(self, order):
+        try:
+            self.submit_order(order)
+        except (InsufficientFundsException, InsufficientStockException, RiskLimitExceededException) as e:
+            # Handle exception and notify user
+            print(f"Order failed: {str(e)}")
+        return order.status
+
+    def _resolve_order(self, future, status):
+        # With the journal on, callers only hear back once the order's records are durable
+        journal = self.journal
+        if journal is None:
+            future.set_result(status)
+        else:
+            journal.resolve_when_durable(future, status)
+
+    def _register_account(self, account):
+        # Registered under the account's lock so a concurrent snapshot sees it together with its journal record
+        with account.lock:
+            self.accounts[account.account_id] = account
+            self.valuation.track_account(account)
+            if self.holdings_matrix is not None:
+                self.holdings_matrix.track(account)
+            if self.journal is not None:
+                user = account.user
+                self.journal.append(JournalRecordType.ACCOUNT, account.account_id, user.user_id, user.name,
+                                    user.email, account.get_balance())
+                account.add_observer(self.journal)
+                account.get_portfolio().add_observer(self.journal)
+
+    def _recover(self, journal):
+        snapshot = journal.load_snapshot()
+        snapshot_lsn = 0
+        open_orders = {}
+        if snapshot is not None:
+            snapshot_lsn = snapshot["lsn"]
+            self.account_id_counter = max(self.account_id_counter, snapshot["account_id_counter"])
+            for symbol, name, price in snapshot["stocks"]:
+                self._restore_stock(symbol, name, price)
+            for account_id, user_id, name, email, balance, holdings in snapshot["accounts"]:
+                self._restore_account(account_id, user_id, name, email, balance, holdings)
+            for order_id, account_id, symbol, side, quantity, filled_quantity, price in snapshot["open_orders"]:
+                open_orders[order_id] = [account_id, symbol, side, quantity, filled_quantity, price]
+
+        last_trade_id = 0
+        for lsn, record_type, fields in journal.read_records(snapshot_lsn):
+            if record_type == JournalRecordType.ACCOUNT:
+                self._restore_account(*fields, {})
+            elif record_type == JournalRecordType.STOCK:
+                self._restore_stock(*fields)
+            elif record_type == JournalRecordType.ORDER:
+                order_id, account_id, symbol, side, quantity, price = fields
+                open_orders[order_id] = [account_id, symbol, side, quantity, 0, price]
+            elif record_type == JournalRecordType.ORDER_REPLACED:
+                order_id, quantity, price = fields
+                if order_id in open_orders:
+                    open_orders[order_id][3] = quantity
+                    open_orders[order_id][5] = price
+            elif record_type == JournalRecordType.EXECUTION:
+                # Re-applies the settlement with the same arithmetic the orders used
+                trade_id, symbol, buy_order_id, sell_order_id, quantity, price = fields
+                last_trade_id = max(last_trade_id, trade_id)
+                stock = self.stocks[symbol]
+                buyer = self.accounts[open_orders[buy_order_id][0]]
+                seller = self.accounts[open_orders[sell_order_id][0]]
+                buyer.withdraw(quantity * price)
+                buyer.get_portfolio().add_stock(stock, quantity)
+                seller.get_portfolio().remove_stock(stock, quantity)
+                seller.deposit(quantity * price)
+                for order_id in (buy_order_id, sell_order_id):
+                    open_orders[order_id][4] += quantity
+                    if open_orders[order_id][4] >= open_orders[order_id][3]:
+                        del open_orders[order_id]
+                stock.update_price(price)
+            elif record_type == JournalRecordType.ORDER_CLOSED:
+                open_orders.pop(fields[0], None)
+            elif record_type == JournalRecordType.BALANCE:
+                account_id, balance = fields
+                self.accounts[account_id].balance = balance
+            elif record_type == JournalRecordType.HOLDING:
+                account_id, symbol, quantity = fields
+                portfolio = self.accounts[account_id].get_portfolio()
+                with portfolio.account.lock:
+                    if quantity:
+                        portfolio.holdings[symbol] = quantity
+                    else:
+                        portfolio.holdings.pop(symbol, None)
+                    portfolio.notify_observers(symbol)
+        # New records must number past the snapshot even when the journal tail behind it is shorter
+        journal.lsn = journal.durable_lsn = max(journal.lsn, snapshot_lsn)
+
+        for order_id, (account_id, symbol, side, quantity, filled_quantity, price) in open_orders.items():
+            order_class = BuyOrder if side == OrderSide.BUY.value else SellOrder
+            order = order_class(order_id, self.accounts[account_id], self.stocks[symbol], quantity, price)
+            order.filled_quantity = filled_quantity
+            if filled_quantity:
+                order.status = OrderStatus.PARTIALLY_FILLED
+            self.matching_engine.restore_order(order)
+        if last_trade_id:
+            self.matching_engine.trade_id_counter = itertools.count(last_trade_id + 1)
+
+    def _restore_stock(self, symbol, name, price):
+        stock = self.stocks.get(symbol)
+        if stock is None:
+            self.add_stock(Stock(symbol, name, price))
+        else:
+            stock.update_price(price)
+
+    def _restore_account(self, account_id, user_id, name, email, balance, holdings):
+        account = Account(account_id, User(user_id, name, email), balance, self.account_locks.get_lock(account_id))
+        account.get_portfolio().holdings.update(holdings)
+        self._register_account(account)
+        if account_id.startswith("A") and account_id[1:].isdigit():
+            self.account_id_counter = max(self.account_id_counter, int(account_id[1:]) + 1)
+
+    def _snapshot_loop(self, interval, stop):
+        while not stop.wait(interval):
+            self.snapshot()
 
     def _generate_account_id(self):
-        account_id = self.account_id_counter
-        self.account_id_counter += 1
+        with self._lock:
+            account_id = self.account_id_counter
+            self.account_id_counter += 1
         return f"A{account_id:09d}"
 
 
+# AsyncOrderGateway class routing orders from asyncio clients to per-symbol sequencer tasks
+class AsyncOrderGateway(OrderEventObserver):
+    def __init__(self, stock_broker, queue_size=1024, num_workers=4):
+        self.stock_broker = stock_broker
+        self.queue_size = queue_size
+        self.queues = {}
+        self.sequencers = []
+        # order -> (loop, future) until the engine closes the order
+        self.pending = {}
+        # The broker is called from these threads, so a lock wait inside it never stalls the event loop
+        self.executor = ThreadPoolExecutor(max_workers=num_workers)
+        stock_broker.matching_engine.add_observer(self)
+
+    async def submit(self, order):
+        # Suspends the client while the symbol's queue is full, then returns a future of the final OrderStatus
+        future = asyncio.get_running_loop().create_future()
+        await self._get_queue(order.stock.get_symbol()).put((order, future))
+        return future
+
+    def try_submit(self, order):
+        # Non-waiting variant, raises asyncio.QueueFull instead of applying backpressure
+        future = asyncio.get_running_loop().create_future()
+        self._get_queue(order.stock.get_symbol()).put_nowait((order, future))
+        return future
+
+    async def place_order(self, order):
+        # Resting orders only complete once they are filled or cancelled
+        return await (await self.submit(order))
+
+    async def cancel_order(self, order_id):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.stock_broker.cancel_order, order_id)
+
+    async def close(self):
+        # Orders still resting at close have their futures cancelled, they stay on the book
+        for queue in list(self.queues.values()):
+            await queue.join()
+        for sequencer in self.sequencers:
+            sequencer.cancel()
+        await asyncio.gather(*self.sequencers, return_exceptions=True)
+        self.stock_broker.matching_engine.observers.remove(self)
+        self.executor.shutdown()
+        for _, future in list(self.pending.values()):
+            future.cancel()
+        self.pending = {}
+        self.queues = {}
+        self.sequencers = []
+
+    def on_order_closed(self, order):
+        self._close(order)
+
+    def _get_queue(self, symbol):
+        queue = self.queues.get(symbol)
+        if queue is None:
+            queue = asyncio.Queue(maxsize=self.queue_size)
+            self.queues[symbol] = queue
+            self.sequencers.append(asyncio.create_task(self._sequence(queue)))
+        return queue
+
+    async def _sequence(self, queue):
+        # One task per symbol, so orders on a symbol reach the engine in arrival order; whatever is queued is
+        # handed to the executor as one batch to amortise the thread hop
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            for order, future in batch:
+                # Registered before submission, the order can close while it is still being matched
+                self.pending[order] = (loop, future)
+            try:
+                await loop.run_in_executor(self.executor, self._submit_batch, batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    def _submit_batch(self, batch):
+        for order, future in batch:
+            try:
+                self.stock_broker.submit_order(order)
+            except (InsufficientFundsException, InsufficientStockException, RiskLimitExceededException):
+                # Orders rejected up front never reach the book, so no close event follows
+                self._close(order)
+            except Exception as e:
+                entry = self.pending.pop(order, None)
+                if entry is not None:
+                    entry[0].call_soon_threadsafe(self._fail, future, e)
+
+    def _close(self, order):
+        entry = self.pending.pop(order, None)
+        if entry is None:
+            return
+        loop, future = entry
+        journal = self.stock_broker.journal
+        if journal is None:
+            loop.call_soon_threadsafe(self._resolve, future, order.status)
+        else:
+            durable = Future()
+            durable.add_done_callback(lambda done: loop.call_soon_threadsafe(self._resolve, future, done.result()))
+            journal.resolve_when_durable(durable, order.status)
+
+    def _resolve(self, future, status):
+        if not future.done():
+            future.set_result(status)
+
+    def _fail(self, future, exception):
+        if not future.done():
+            future.set_exception(exception)
+
+
 # User class representing a customer using the brokerage system
 class User:
     def __init__(self, user_id, name, email):
@@ -192,16 +1886,144 @@ class User:
         self.email = email
 
 
+# Enum for the kind of record in a tick file
+class TickRecordType(Enum):
+    PRICE = 0
+    ORDER = 1
+
+
+# TickFile class for the fixed-size binary tick/order records read by TickReplayEngine
+class TickFile:
+    MAGIC = b"TICK"
+    HEADER = struct.Struct("<4sI")  # magic, symbol count
+    SYMBOL = struct.Struct("<16s")
+    RECORD = struct.Struct("<qdIIHBB")  # timestamp_us, price, quantity, account index, symbol index, type, side
+    WRITE_BATCH = 65536
+
+    @staticmethod
+    def write(path, symbols, records):
+        # records yields (timestamp_us, record_type, symbol_index, price, quantity, account_index, side)
+        record = TickFile.RECORD
+        with open(path, "wb") as file:
+            file.write(TickFile.HEADER.pack(TickFile.MAGIC, len(symbols)))
+            for symbol in symbols:
+                file.write(TickFile.SYMBOL.pack(symbol.encode("ascii")))
+            buffer = bytearray()
+            written = 0
+            for timestamp_us, record_type, symbol_index, price, quantity, account_index, side in records:
+                buffer += record.pack(timestamp_us, price, quantity, account_index, symbol_index,
+                                      record_type.value, side.value)
+                written += 1
+                if written % TickFile.WRITE_BATCH == 0:
+                    file.write(buffer)
+                    buffer.clear()
+            file.write(buffer)
+        return written
+
+
+# TickReplayEngine class replaying a memory-mapped tick file into the broker for backtests
+class TickReplayEngine:
+    def __init__(self, stock_broker, path, speed=None, accounts=None, order_prefix="R", max_pending=10000):
+        self.stock_broker = stock_broker
+        self.path = path
+        # None replays as fast as possible, otherwise file time is scaled by speed against the wall clock
+        self.speed = speed
+        self.accounts = accounts
+        self.order_prefix = order_prefix
+        self.max_pending = max_pending
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, symbol_count = TickFile.HEADER.unpack_from(self.map, 0)
+        if magic != TickFile.MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a tick file")
+        offset = TickFile.HEADER.size
+        self.symbols = []
+        for _ in range(symbol_count):
+            self.symbols.append(TickFile.SYMBOL.unpack_from(self.map, offset)[0].rstrip(b"\0").decode("ascii"))
+            offset += TickFile.SYMBOL.size
+        self.data_offset = offset
+        self.record_count = (len(self.map) - offset) // TickFile.RECORD.size
+
+    def get_record_count(self):
+        return self.record_count
+
+    def replay(self, start=0, limit=None):
+        stock_broker = self.stock_broker
+        stocks = [stock_broker.stocks[symbol] for symbol in self.symbols]
+        account_cache = {}
+        pending = deque()
+        end = self.record_count if limit is None else min(self.record_count, start + limit)
+        record_size = TickFile.RECORD.size
+        price_updates = 0
+        orders = 0
+        first_timestamp = None
+        speed = self.speed
+        order_prefix = self.order_prefix
+        started = time.perf_counter()
+        # iter_unpack over a memoryview decodes straight out of the page cache, only touched pages are resident
+        with memoryview(self.map) as view:
+            records = view[self.data_offset + start * record_size:self.data_offset + end * record_size]
+            for index, (timestamp_us, price, quantity, account_index, symbol_index, record_type, side) in enumerate(
+                    TickFile.RECORD.iter_unpack(records), start):
+                if speed is not None:
+                    if first_timestamp is None:
+                        first_timestamp = timestamp_us
+                    delay = (timestamp_us - first_timestamp) / 1e6 / speed - (time.perf_counter() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+                stock = stocks[symbol_index]
+                if record_type == TickRecordType.PRICE.value:
+                    stock.update_price(price)
+                    price_updates += 1
+                    continue
+                account = account_cache.get(account_index)
+                if account is None:
+                    account = self._resolve_account(account_index)
+                    account_cache[account_index] = account
+                order_class = BuyOrder if side == OrderSide.BUY.value else SellOrder
+                result = stock_broker.place_order(order_class(f"{order_prefix}{index}", account, stock, quantity, price))
+                orders += 1
+                if isinstance(result, Future):
+                    # Bound the in-flight orders so a long file cannot run ahead of the worker lanes
+                    pending.append(result)
+                    if len(pending) > self.max_pending:
+                        pending.popleft().result()
+            records.release()
+        wait(pending)
+        elapsed = time.perf_counter() - started
+        events = price_updates + orders
+        return {
+            "events": events,
+            "price_updates": price_updates,
+            "orders": orders,
+            "elapsed": elapsed,
+            "events_per_sec": events / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def _resolve_account(self, account_index):
+        if self.accounts is not None:
+            return self.accounts[account_index]
+        return self.stock_broker.accounts[f"A{account_index:09d}"]
+
+
 # StockBrokerageSystemDemo class to run a demo of the system
 class StockBrokerageSystemDemo:
     @staticmethod
     def run():
         stock_broker = StockBroker()
 
-        # Create user and account
+        # Create users and accounts
         user = User("U001", "John Doe", "john@example.com")
         stock_broker.create_account(user, 10000.0)
         account = stock_broker.get_account("A000000001")
+        seller = User("U002", "Jane Smith", "jane@example.com")
+        stock_broker.create_account(seller, 0.0)
+        seller_account = stock_broker.get_account("A000000002")
 
         # Add stocks to the stock broker
         stock1 = Stock("AAPL", "Apple Inc.", 150.0)
@@ -209,19 +2031,264 @@ class StockBrokerageSystemDemo:
         stock_broker.add_stock(stock1)
         stock_broker.add_stock(stock2)
 
-        # Place buy orders
-        buy_order1 = BuyOrder("O001", account, stock1, 10, 150.0)
-        buy_order2 = BuyOrder("O002", account, stock2, 5, 2000.0)
+        # Seed the seller's holdings and rest their asks on the books
+        seller_account.get_portfolio().add_stock(stock1, 20)
+        seller_account.get_portfolio().add_stock(stock2, 5)
+        stock_broker.place_order(SellOrder("O001", seller_account, stock1, 20, 150.0))
+        stock_broker.place_order(SellOrder("O002", seller_account, stock2, 5, 2000.0))
+
+        # Place buy orders, matched against the resting asks
+        buy_order1 = BuyOrder("O003", account, stock1, 10, 150.0)
+        buy_order2 = BuyOrder("O004", account, stock2, 5, 2000.0)
         stock_broker.place_order(buy_order1)
         stock_broker.place_order(buy_order2)
 
-        # Place sell orders
-        sell_order1 = SellOrder("O003", account, stock1, 5, 160.0)
+        # Place a sell order above the best ask, it rests on the book
+        sell_order1 = SellOrder("O005", account, stock1, 5, 160.0)
         stock_broker.place_order(sell_order1)
+        book = stock_broker.get_order_book("AAPL")
+        print(f"AAPL best bid: {book.best_bid_price()}, best ask: {book.best_ask_price()}")
+
+        # Reprice the resting sell order, then cancel it
+        stock_broker.replace_order("O005", price=155.0)
+        stock_broker.cancel_order("O005")
+        print(f"Order O005 status: {sell_order1.status.name}")
 
         # Print account balance and portfolio
         print(f"Account Balance: ${account.get_balance()}")
         print(f"Portfolio: {account.get_portfolio().get_holdings()}")
+        print(f"Portfolio Value: ${stock_broker.get_portfolio_value(account.account_id)}")
+
+
+# StockBrokerConcurrencyBenchmark class stressing the worker pool and checking balance invariants
+class StockBrokerConcurrencyBenchmark:
+    @staticmethod
+    def run(num_accounts=64, num_symbols=16, num_orders=20000, worker_counts=(1, 2, 4, 8), venue_latency=0.0002):
+        # Every order goes through StockBroker.place_order and its account lane Future. The first pass measures
+        # the broker alone; the second adds a simulated venue round trip per order, which is the blocking work
+        # extra lanes can overlap, so its scaling reflects the sleep rather than any parallel matching
+        stock_broker = StockBroker()
+        user = User("U-BENCH", "Benchmark", "bench@example.com")
+        print(f"{'mode':>24} {'workers':>8} {'orders/sec':>12} {'min balance':>14} {'min holding':>12} {'conserved':>10}")
+        modes = [("no venue latency", 0.0)]
+        if venue_latency:
+            modes.append((f"simulated {venue_latency * 1e6:.0f}us venue", venue_latency))
+        round_number = 0
+        for mode, latency in modes:
+            for num_workers in worker_counts:
+                StockBrokerConcurrencyBenchmark._run_round(stock_broker, user, round_number, mode, latency, num_accounts,
+                                                           num_symbols, num_orders, num_workers)
+                round_number += 1
+
+    @staticmethod
+    def _run_round(stock_broker, user, round_number, mode, venue_latency, num_accounts, num_symbols, num_orders,
+                   num_workers):
+        stocks = [Stock(f"B{round_number}S{i}", f"Bench {i}", 100.0) for i in range(num_symbols)]
+        for stock in stocks:
+            stock_broker.add_stock(stock)
+        accounts = []
+        for _ in range(num_accounts):
+            account = stock_broker.create_account(user, 10000000.0)
+            for stock in stocks:
+                account.get_portfolio().add_stock(stock, 100000)
+            accounts.append(account)
+        total_cash = sum(account.get_balance() for account in accounts)
+
+        rng = random.Random(round_number)
+        orders = []
+        for i in range(num_orders):
+            order_class = BuyOrder if rng.random() < 0.5 else SellOrder
+            price = round(100.0 + rng.uniform(-2.0, 2.0), 2)
+            orders.append(order_class(f"B{round_number}O{i}", rng.choice(accounts), rng.choice(stocks),
+                                      rng.randint(1, 20), price))
+
+        if venue_latency:
+            # Shadow submit_order on the instance so the delay sits inside the lane, behind place_order
+            submit_order = stock_broker.submit_order
+
+            def routed_submit_order(order):
+                time.sleep(venue_latency)
+                return submit_order(order)
+
+            stock_broker.submit_order = routed_submit_order
+        stock_broker.start_order_workers(num_workers)
+        try:
+            start = time.perf_counter()
+            wait([stock_broker.place_order(order) for order in orders])
+            elapsed = time.perf_counter() - start
+        finally:
+            stock_broker.shutdown()
+            stock_broker.__dict__.pop("submit_order", None)
+
+        min_balance = min(account.get_balance() for account in accounts)
+        min_holding = min(min(account.get_portfolio().get_holdings().values(), default=0) for account in accounts)
+        conserved = abs(sum(account.get_balance() for account in accounts) - total_cash) < 1e-6 and all(
+            sum(account.get_portfolio().get_holdings().get(stock.get_symbol(), 0) for account in accounts)
+            == 100000 * num_accounts for stock in stocks)
+        print(f"{mode:>24} {num_workers:>8} {num_orders / elapsed:>12.0f} {min_balance:>14.2f} {min_holding:>12} "
+              f"{str(conserved):>10}")
+
+
+# StockBrokerJournalBenchmark class comparing sustained order throughput with the journal off and on
+class StockBrokerJournalBenchmark:
+    @staticmethod
+    def run(num_accounts=64, num_symbols=16, num_orders=20000, num_workers=4, repeats=2):
+        stock_broker = StockBroker()
+        user = User("U-JOURNAL", "Journal Benchmark", "journal@example.com")
+        elapsed_by_mode = {False: 0.0, True: 0.0}
+        # Each repeat runs off, on, on, off: state builds up in the singleton from round to round, and summing
+        # whole blocks cancels that drift instead of crediting whichever mode ran first
+        for round_number in range(repeats * 4):
+            journaled = round_number % 4 in (1, 2)
+            with tempfile.TemporaryDirectory() as directory:
+                if journaled:
+                    stock_broker.enable_journal(directory)
+                stocks = [Stock(f"J{round_number}S{i}", f"Journal {i}", 100.0) for i in range(num_symbols)]
+                for stock in stocks:
+                    stock_broker.add_stock(stock)
+                accounts = [stock_broker.create_account(user, 1e9) for _ in range(num_accounts)]
+                for account in accounts:
+                    for stock in stocks:
+                        account.get_portfolio().add_stock(stock, 1000000)
+
+                rng = random.Random(round_number // 2)
+                orders = []
+                for i in range(num_orders):
+                    order_class = BuyOrder if rng.random() < 0.5 else SellOrder
+                    price = round(100.0 + rng.uniform(-2.0, 2.0), 2)
+                    orders.append(order_class(f"J{round_number}O{i}", rng.choice(accounts), rng.choice(stocks),
+                                              rng.randint(1, 20), price))
+
+                # Throughput counts an order only once its future resolves, i.e. once it is durable
+                stock_broker.start_order_workers(num_workers)
+                # Earlier rounds' objects are frozen out of the collector, or every round pays for all before it
+                gc.collect()
+                gc.freeze()
+                start = time.perf_counter()
+                wait([stock_broker.place_order(order) for order in orders])
+                elapsed = time.perf_counter() - start
+                gc.unfreeze()
+                stock_broker.shutdown()
+                if journaled:
+                    stock_broker.disable_journal()
+                elapsed_by_mode[journaled] += elapsed
+        results = {journaled: repeats * 2 * num_orders / elapsed for journaled, elapsed in elapsed_by_mode.items()}
+        print(f"journal off: {results[False]:>10.0f} orders/sec")
+        print(f"journal on : {results[True]:>10.0f} orders/sec")
+        print(f"journal cost: {(1 - results[True] / results[False]) * 100:.1f}%")
+
+
+# AsyncOrderGatewayBenchmark class driving the gateway with an in-process load generator
+class AsyncOrderGatewayBenchmark:
+    @staticmethod
+    def run(num_clients=100, orders_per_client=200, num_symbols=8, queue_size=64):
+        stock_broker = StockBroker()
+        user = User("U-GATEWAY", "Gateway Benchmark", "gateway@example.com")
+        stocks = [Stock(f"G{i}", f"Gateway {i}", 100.0) for i in range(num_symbols)]
+        for stock in stocks:
+            stock_broker.add_stock(stock)
+        accounts = [stock_broker.create_account(user, 1e9) for _ in range(num_clients)]
+        for account in accounts:
+            for stock in stocks:
+                account.get_portfolio().add_stock(stock, 1000000)
+        print(asyncio.run(AsyncOrderGatewayBenchmark._load(stock_broker, accounts, stocks, orders_per_client, queue_size)))
+
+    @staticmethod
+    async def _load(stock_broker, accounts, stocks, orders_per_client, queue_size):
+        gateway = AsyncOrderGateway(stock_broker, queue_size)
+        orders = []
+        futures = []
+        backpressured = 0
+
+        async def client(client_id, account):
+            nonlocal backpressured
+            rng = random.Random(client_id)
+            for i in range(orders_per_client):
+                order_class = BuyOrder if rng.random() < 0.5 else SellOrder
+                stock = rng.choice(stocks)
+                order = order_class(f"G-{client_id}-{i}", account, stock, rng.randint(1, 20),
+                                    round(100.0 + rng.uniform(-2.0, 2.0), 2))
+                queue = gateway.queues.get(stock.get_symbol())
+                if queue is not None and queue.full():
+                    backpressured += 1
+                orders.append(order)
+                futures.append(await gateway.submit(order))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client(client_id, account) for client_id, account in enumerate(accounts)))
+        for queue in list(gateway.queues.values()):
+            await queue.join()
+        elapsed = time.perf_counter() - start
+        # Orders still resting are cancelled so that every future completes with a final status
+        await asyncio.gather(*(gateway.cancel_order(order.order_id) for order in orders if order.is_active()))
+        statuses = {}
+        for status in await asyncio.gather(*futures):
+            statuses[status.name] = statuses.get(status.name, 0) + 1
+        await gateway.close()
+        total = len(accounts) * orders_per_client
+        return (f"{total} orders from {len(accounts)} clients: {total / elapsed:.0f} orders/sec, "
+                f"{backpressured} submits hit a full queue, final statuses {statuses}")
+
+
+# PreTradeRiskBenchmark class timing the per-order cost of the pre-trade risk check
+class PreTradeRiskBenchmark:
+    @staticmethod
+    def run(num_accounts=1000, num_symbols=100, num_orders=200000):
+        risk_engine = PreTradeRiskEngine(RiskLimits(max_order_notional=1e6, max_open_orders=1000,
+                                                    max_account_exposure=1e9, max_symbol_exposure=1e12))
+        user = User("U-RISK", "Risk Benchmark", "risk@example.com")
+        accounts = [Account(f"R{i:09d}", user, 0.0) for i in range(num_accounts)]
+        stocks = [Stock(f"R{i}", f"Risk {i}", 100.0) for i in range(num_symbols)]
+        rng = random.Random(7)
+        orders = [BuyOrder(f"R{i}", rng.choice(accounts), rng.choice(stocks), rng.randint(1, 100), 100.0)
+                  for i in range(num_orders)]
+
+        start = time.perf_counter()
+        for order in orders:
+            risk_engine.check(order)
+        check_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        for order in orders:
+            risk_engine.release(order)
+        release_elapsed = time.perf_counter() - start
+        print(f"check:   {check_elapsed / num_orders * 1e6:.2f} us/order")
+        print(f"release: {release_elapsed / num_orders * 1e6:.2f} us/order")
+
+
+# TickReplayBenchmark class generating a tick file and replaying it at full speed
+class TickReplayBenchmark:
+    @staticmethod
+    def run(num_accounts=100, num_symbols=16, num_records=200000, order_ratio=0.5):
+        stock_broker = StockBroker()
+        user = User("U-REPLAY", "Replay Benchmark", "replay@example.com")
+        symbols = [f"T{i}" for i in range(num_symbols)]
+        stocks = [Stock(symbol, f"Replay {symbol}", 100.0) for symbol in symbols]
+        for stock in stocks:
+            stock_broker.add_stock(stock)
+        accounts = [stock_broker.create_account(user, 1e12) for _ in range(num_accounts)]
+        for account in accounts:
+            for stock in stocks:
+                account.get_portfolio().add_stock(stock, 10 ** 9)
+
+        rng = random.Random(11)
+
+        def records():
+            for i in range(num_records):
+                price = round(100.0 + rng.uniform(-2.0, 2.0), 2)
+                if rng.random() < order_ratio:
+                    yield (i * 1000, TickRecordType.ORDER, rng.randrange(num_symbols), price, rng.randint(1, 20),
+                           rng.randrange(num_accounts), rng.choice((OrderSide.BUY, OrderSide.SELL)))
+                else:
+                    yield i * 1000, TickRecordType.PRICE, rng.randrange(num_symbols), price, 0, 0, OrderSide.BUY
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ticks.bin")
+            TickFile.write(path, symbols, records())
+            engine = TickReplayEngine(stock_broker, path, accounts=accounts)
+            report = engine.replay()
+            engine.close()
+        print(f"{report['events']} events ({report['orders']} orders, {report['price_updates']} price updates): "
+              f"{report['events_per_sec']:.0f} events/sec")
 
 
 if __name__ == "__main__":